@@ -3,7 +3,6 @@ from flask_cors import CORS
 from supabase import create_client, Client
 import os
 from dotenv import load_dotenv
-from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 from datetime import datetime, timedelta, timezone
 import logging
@@ -11,11 +10,30 @@ import hashlib
 import secrets
 import sys
 sys.path.append('.')
+# Shared helpers (utils/) live in the backend root, one level up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.passwords import hash_password, verify_password, needs_rehash, rehash_in_background
+from utils.permissions import PermissionRegistry
+from utils.cache import TTLCache
+from utils.db import execute_recipe_write
+from utils.compression import ResponseCompressor
+from utils.json_provider import use_fast_json
+from utils.validation import validate_body, request_body, MAX_BODY_BYTES
+from utils.request_schemas import CREDENTIALS, ADMIN_USER, ADMIN_RECIPE, ADMIN_MEAL_PLAN
 try:
     from admin_recipe_sync import sync_recipe_to_discover, notify_meal_plan_apps
 except ImportError:
     def sync_recipe_to_discover(*args, **kwargs): pass
-    def notify_meal_plan_apps(*args, **kwargs): pass
+    def notify_meal_plan_apps(recipe, action):
+        """Record the change in recipe_notifications; user apps use it to refresh their discover feed cache"""
+        supabase.table('recipe_notifications').insert({
+            'type': 'admin_recipe',
+            'action': action,
+            'recipe_id': recipe.get('id'),
+            'recipe_title': recipe.get('title'),
+            'data': {'recipe_id': str(recipe.get('id'))},
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }).execute()
 
 try:
     from meal_plan_sync import sync_meal_plan_to_users
@@ -30,6 +48,15 @@ CORS(app, origins='*', methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'], allo
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+# Hard cap on request bodies; validated routes apply tighter per-schema limits
+app.config['MAX_CONTENT_LENGTH'] = MAX_BODY_BYTES
+
+# orjson-backed jsonify when installed
+use_fast_json(app)
+
+# gzip/br for large JSON bodies such as the recipe and user-recipe listings
+ResponseCompressor(app)
+
 # Supabase configuration
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
@@ -45,13 +72,32 @@ except Exception as e:
     logging.error(f'Failed to create Supabase client: {e}')
     raise
 
+# Columns returned by recipe list endpoints unless ?view=full is requested
+ADMIN_RECIPE_SUMMARY_COLUMNS = 'id, title, image, cook_time, servings, difficulty, category, author, status, created_at'
+
+def wants_full_view():
+    return request.args.get('view') == 'full'
+
+permission_registry = PermissionRegistry(supabase, refresh_interval=int(os.getenv('PERMISSION_REFRESH_INTERVAL', 300)))
+
 def get_admin_permissions(role):
     """Get permissions for admin role"""
-    try:
-        result = supabase.table('admin_role_permissions').select('admin_permissions(name)').eq('role', role).execute()
-        return [item['admin_permissions']['name'] for item in result.data]
-    except:
-        return []
+    return permission_registry.get(role)
+
+# Active admin identities for the verify endpoint, which the dashboard polls constantly
+ADMIN_IDENTITY_COLUMNS = 'id, email, name, role'
+admin_identity_cache = TTLCache(maxsize=1000, ttl=int(os.getenv('ADMIN_IDENTITY_CACHE_TTL', 60)))
+
+def get_admin_identity(admin_id):
+    """Get an active admin's identity, cached for ADMIN_IDENTITY_CACHE_TTL seconds"""
+    admin = admin_identity_cache.get(str(admin_id))
+    if admin is None:
+        result = supabase.table('admin_users').select(ADMIN_IDENTITY_COLUMNS).eq('id', admin_id).eq('is_active', True).execute()
+        if not result.data:
+            return None
+        admin = result.data[0]
+        admin_identity_cache.set(str(admin_id), admin)
+    return admin
 
 def verify_admin_token(token):
     """Verify admin JWT token"""
@@ -63,17 +109,25 @@ def verify_admin_token(token):
     except jwt.InvalidTokenError:
         return None
 
+def admin_token_error():
+    """The 401 an admin route returns for a missing or bad token, or None; runs ahead of @validate_body"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    if not verify_admin_token(token):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
 @app.route('/api/admin/health', methods=['GET'])
 def admin_health_check():
     return jsonify({'status': 'ok', 'message': 'Admin backend is running'}), 200
 
 @app.route('/api/admin/auth/login', methods=['POST', 'OPTIONS'])
+@validate_body(CREDENTIALS)
 def admin_login():
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        data = request.get_json()
+        data = request_body()
         email = data.get('email')
         password = data.get('password')
         
@@ -89,9 +143,16 @@ def admin_login():
         admin = admin_result.data[0]
         
         # Verify password
-        if not check_password_hash(admin['password_hash'], password):
+        if not verify_password(admin['password_hash'], password):
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        # Upgrade outdated hashes in the background
+        if needs_rehash(admin['password_hash']):
+            old_hash = admin['password_hash']
+            rehash_in_background(password, lambda new_hash: supabase.table('admin_users').update({
+                'password_hash': new_hash
+            }).eq('id', admin['id']).eq('password_hash', old_hash).execute())
+        
         # Get permissions
         permissions = get_admin_permissions(admin['role'])
         
@@ -151,10 +212,9 @@ def verify_admin_token_endpoint():
         if not payload:
             return jsonify({'error': 'Invalid token'}), 401
         
-        # Get full admin data
-        admin_result = supabase.table('admin_users').select('*').eq('id', payload['admin_id']).eq('is_active', True).execute()
-        if admin_result.data:
-            admin = admin_result.data[0]
+        # Get admin identity
+        admin = get_admin_identity(payload['admin_id'])
+        if admin:
             permissions = get_admin_permissions(admin['role'])
             return jsonify({
                 'admin': {
@@ -194,6 +254,7 @@ def admin_logout():
 
 # Recipe Management Endpoints
 @app.route('/api/admin/recipes', methods=['GET', 'POST', 'OPTIONS'])
+@validate_body({'POST': ADMIN_RECIPE}, authenticate=admin_token_error)
 def admin_recipes():
     if request.method == 'OPTIONS':
         return '', 200
@@ -207,12 +268,13 @@ def admin_recipes():
         
         if request.method == 'GET':
             # Get all admin recipes
-            result = supabase.table('admin_recipes').select('*').order('created_at', desc=True).execute()
+            columns = '*' if wants_full_view() else ADMIN_RECIPE_SUMMARY_COLUMNS
+            result = supabase.table('admin_recipes').select(columns).order('created_at', desc=True).execute()
             return jsonify({'recipes': result.data}), 200
             
         elif request.method == 'POST':
             # Create new recipe
-            data = request.get_json()
+            data = request_body()
             
             if not data.get('title'):
                 return jsonify({'error': 'Recipe title is required'}), 400
@@ -236,7 +298,7 @@ def admin_recipes():
             }
             
             # Insert recipe
-            result = supabase.table('admin_recipes').insert(recipe_data).execute()
+            result = execute_recipe_write(lambda row: supabase.table('admin_recipes').insert(row), recipe_data)
             
             if result.data:
                 recipe = result.data[0]
@@ -259,6 +321,7 @@ def admin_recipes():
         return jsonify({'error': 'Recipe operation failed'}), 500
 
 @app.route('/api/admin/recipes/<recipe_id>', methods=['PUT', 'DELETE', 'OPTIONS'])
+@validate_body({'PUT': ADMIN_RECIPE}, authenticate=admin_token_error)
 def admin_recipe_detail(recipe_id):
     if request.method == 'OPTIONS':
         return '', 200
@@ -272,7 +335,7 @@ def admin_recipe_detail(recipe_id):
         
         if request.method == 'PUT':
             # Update recipe
-            data = request.get_json()
+            data = request_body()
             
             update_data = {
                 'title': data.get('title'),
@@ -293,7 +356,7 @@ def admin_recipe_detail(recipe_id):
             # Remove None values
             update_data = {k: v for k, v in update_data.items() if v is not None}
             
-            result = supabase.table('admin_recipes').update(update_data).eq('id', recipe_id).execute()
+            result = execute_recipe_write(lambda row: supabase.table('admin_recipes').update(row).eq('id', recipe_id), update_data)
             
             if result.data:
                 recipe = result.data[0]
@@ -321,10 +384,13 @@ def admin_recipe_detail(recipe_id):
                 # Delete recipe
                 supabase.table('admin_recipes').delete().eq('id', recipe_id).execute()
                 
-                # Sync deletion to discover page
-                sync_recipe_to_discover(recipe, 'delete')
-                # Notify meal plan apps
-                notify_meal_plan_apps(recipe, 'delete')
+                try:
+                    # Sync deletion to discover page
+                    sync_recipe_to_discover(recipe, 'delete')
+                    # Notify meal plan apps
+                    notify_meal_plan_apps(recipe, 'delete')
+                except Exception as sync_error:
+                    logging.error(f'Delete sync failed: {sync_error}')
                 
                 return jsonify({'message': 'Recipe deleted and synced successfully'}), 200
             else:
@@ -360,6 +426,7 @@ def get_admin_users():
         return jsonify({'error': 'Failed to get admin users'}), 500
 
 @app.route('/api/admin/users', methods=['POST'])
+@validate_body(ADMIN_USER, authenticate=admin_token_error)
 def create_admin_user():
     try:
         token = request.headers.get('Authorization', '').replace('Bearer ', '')
@@ -372,7 +439,7 @@ def create_admin_user():
         if 'admin_management' not in payload.get('permissions', []):
             return jsonify({'error': 'Insufficient permissions'}), 403
         
-        data = request.get_json()
+        data = request_body()
         email = data.get('email')
         password = data.get('password')
         name = data.get('name')
@@ -392,7 +459,7 @@ def create_admin_user():
         # Create admin
         admin_data = {
             'email': email,
-            'password_hash': generate_password_hash(password),
+            'password_hash': hash_password(password),
             'name': name,
             'role': role,
             'created_by': payload['admin_id']
@@ -440,7 +507,9 @@ def get_discover_recipes():
     
     try:
         # Get admin recipes
-        result = supabase.table('admin_recipes').select('*').order('created_at', desc=True).execute()
+        full = wants_full_view()
+        columns = '*' if full else ADMIN_RECIPE_SUMMARY_COLUMNS
+        result = supabase.table('admin_recipes').select(columns).order('created_at', desc=True).execute()
         
         # Format for discover page
         recipes = []
@@ -452,13 +521,14 @@ def get_discover_recipes():
                 'time': f"{recipe.get('cook_time', 30)} min",
                 'servings': recipe.get('servings', 1),
                 'image': recipe.get('image', '🍽️'),
-                'ingredients': recipe.get('ingredients', []),
-                'instructions': recipe.get('instructions', []),
                 'difficulty': recipe.get('difficulty', 'medium'),
                 'category': recipe.get('category', 'Main'),
                 'author': recipe.get('author', 'Admin'),
                 'created_at': recipe.get('created_at')
             }
+            if full:
+                formatted_recipe['ingredients'] = recipe.get('ingredients', [])
+                formatted_recipe['instructions'] = recipe.get('instructions', [])
             recipes.append(formatted_recipe)
         
         return jsonify({'recipes': recipes}), 200
@@ -469,6 +539,7 @@ def get_discover_recipes():
 
 # Admin Meal Plan Management Endpoints
 @app.route('/api/admin/meal-plans', methods=['GET', 'POST', 'OPTIONS'])
+@validate_body({'POST': ADMIN_MEAL_PLAN}, authenticate=admin_token_error)
 def admin_meal_plans():
     if request.method == 'OPTIONS':
         return '', 200
@@ -487,7 +558,7 @@ def admin_meal_plans():
             
         elif request.method == 'POST':
             # Create new meal plan
-            data = request.get_json()
+            data = request_body()
             
             if not data.get('name'):
                 return jsonify({'error': 'Meal plan name is required'}), 400
@@ -1,25 +1,59 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, make_response
 from flask_cors import CORS
 from supabase import create_client, Client
 import os
 from dotenv import load_dotenv
-from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 from datetime import datetime, timedelta, timezone
 import logging
+import hashlib
+import threading
+import time
+import heapq
+import re
+from itertools import islice
 from functools import wraps
+from utils.cache import TTLCache, VersionedCache
+from utils.pagination import encode_cursor, decode_cursor, parse_page_size
+from utils.analytics import AnalyticsWriter
+from utils.auth import decode_token
+from utils.passwords import hash_password, verify_password, needs_rehash, rehash_in_background
+from utils.permissions import PermissionRegistry, DEFAULT_ROLE_PERMISSIONS
+from utils.compression import ResponseCompressor
+from utils.json_provider import use_fast_json, json_bytes
+from utils.validation import validate_body, request_body, ValidationError, MAX_BODY_BYTES
+from utils.request_schemas import (
+    CREDENTIALS, PROFILE_UPDATE, PASSWORD_CHANGE, RECIPE, SAVED_RECIPE, INGREDIENT_LINES,
+    SHOPPING_ITEM, SHOPPING_ITEM_UPDATE, SHOPPING_BULK, SHOPPING_GENERATE, PERSON, PREFERENCES,
+    MEAL, MEAL_SLOTS, MEAL_PLAN_COPY, MEAL_PLAN_BULK, APPLY_TEMPLATE,
+    ADMIN_USER, ADMIN_RECIPE, ADMIN_MEAL_PLAN, SUBSCRIPTION_PLAN, MAX_RANGE_WEEKS
+)
+from utils.ingredients import aggregate_ingredients, parse_ingredients, recipe_ingredients, IngredientIndex
+from utils.search import SearchIndex
+from utils.db import is_missing_function, is_missing_conflict_target, execute_recipe_write
+from utils.profiles import get_profile, cache_profile, invalidate_profile
 
 load_dotenv()
 
 app = Flask(__name__)
 # Configure CORS
-CORS(app, origins='*', methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'], allow_headers=['Content-Type', 'Authorization'], supports_credentials=True)
+CORS(app, origins='*', methods=['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'], allow_headers=['Content-Type', 'Authorization', 'Idempotency-Key', 'If-None-Match'], expose_headers=['ETag'], supports_credentials=True)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+# Hard cap on request bodies; validated routes apply tighter per-schema limits
+app.config['MAX_CONTENT_LENGTH'] = MAX_BODY_BYTES
+
+# orjson-backed app.json when installed; jsonify and json_bytes both go through it
+use_fast_json(app)
+
+# gzip/br for large JSON bodies; bytes of ETagged responses are compressed once per version
+ResponseCompressor(app)
+
 # Analytics helper function
 def track_event(user_id, event_type, event_data=None):
+    # Queued and written in batches by analytics_writer, off the request thread
     try:
         analytics_data = {
             'user_id': user_id,
@@ -27,7 +61,7 @@ def track_event(user_id, event_type, event_data=None):
             'event_data': event_data or {},
             'created_at': datetime.now(timezone.utc).isoformat()
         }
-        supabase.table('user_analytics').insert(analytics_data).execute()
+        analytics_writer.enqueue(analytics_data)
     except Exception as e:
         logging.warning(f'Analytics tracking failed: {e}')
 
@@ -40,7 +74,7 @@ def track_usage(event_type):
                 # Get user_id from JWT token
                 token = request.headers.get('Authorization', '').replace('Bearer ', '')
                 if token:
-                    payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+                    payload = decode_token(token, JWT_SECRET)
                     user_id = payload.get('user_id')
                     if user_id:
                         track_event(user_id, event_type, {
@@ -74,9 +108,307 @@ except Exception as e:
     logging.error(f'Failed to create Supabase client: {e}')
     raise
 
+analytics_writer = AnalyticsWriter(
+    supabase,
+    max_queue=int(os.getenv('ANALYTICS_QUEUE_SIZE', 10000)),
+    batch_size=int(os.getenv('ANALYTICS_BATCH_SIZE', 100)),
+    flush_interval=float(os.getenv('ANALYTICS_FLUSH_INTERVAL', 2.0))
+)
+
+# Column projections for list endpoints; full ingredients/instructions come from the details endpoints
+RECIPE_SUMMARY_COLUMNS = 'id, user_id, title, image, cook_time, prep_time, servings, difficulty, tags, created_at'
+ADMIN_RECIPE_SUMMARY_COLUMNS = 'id, title, image, cook_time, servings, difficulty, category, author, status, created_at'
+USER_RECIPE_SUMMARY_COLUMNS = 'id, user_id, recipe_id, recipe_name, is_saved, is_favorite, accessed_at, saved_at'
+MAX_DETAIL_IDS = 50
+
+def wants_full_view():
+    """List endpoints return summaries unless the client asks for ?view=full"""
+    return request.args.get('view') == 'full'
+
+# Conditional GET: per-user list ETags come from the (id, updated_at) pairs of the rows,
+# so an unchanged list costs one narrow query and is never loaded or serialized
+def user_rows_etag(query):
+    """ETag for the rows selected by query (which must select id, updated_at), or None if it fails"""
+    try:
+        rows = query.execute().data
+    except Exception as db_error:
+        logging.warning(f'ETag version query failed: {db_error}')
+        return None
+    versions = sorted((str(row.get('id')), str(row.get('updated_at'))) for row in rows)
+    return hashlib.sha1(repr((request.full_path, versions)).encode('utf-8')).hexdigest()
+
+def fallback_response(body):
+    """200 with body for when a read failed; conditional_response gives it no ETag, so a
+    client never revalidates against it and keeps getting 304s for an empty list"""
+    response = make_response(jsonify(body), 200)
+    response.cache_control.no_store = True
+    return response
+
+def conditional_response(etag, build):
+    """304 if the client's If-None-Match already has etag, otherwise build(); None skips the check"""
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = make_response(build())
+    if etag is not None and response.status_code in (200, 304) and not response.cache_control.no_store:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def upgrade_password_hash(table, row_id, old_hash, password):
+    """After a successful login, re-hash with the current method/cost off the request path"""
+    if not needs_rehash(old_hash):
+        return
+    
+    def store(new_hash):
+        # Guard on the old hash so a concurrent password change is never overwritten
+        supabase.table(table).update({'password_hash': new_hash}).eq('id', row_id).eq('password_hash', old_hash).execute()
+    
+    rehash_in_background(password, store)
+
+def user_token_error():
+    """The 401 a user route returns for a missing or bad token, or None; runs ahead of @validate_body"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    if not token:
+        return jsonify({'error': 'Token required'}), 401
+    try:
+        decode_token(token, JWT_SECRET)
+    except jwt.ExpiredSignatureError:
+        return jsonify({'error': 'Token expired'}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({'error': 'Invalid token'}), 401
+    return None
+
+def get_user_profile(user_id):
+    """Cached profile row for a user (served by /api/auth/verify), or None if the user doesn't exist"""
+    return get_profile(supabase, user_id)
+
+def format_user_profile(user):
+    return {
+        'id': user['id'],
+        'email': user['email'],
+        'name': user.get('name'),
+        'phone': user.get('phone'),
+        'location': user.get('location'),
+        'bio': user.get('bio')
+    }
+
+# Author lookups shared by the discover feed and recipe details
+author_cache = TTLCache(
+    maxsize=int(os.getenv('AUTHOR_CACHE_SIZE', 5000)),
+    ttl=int(os.getenv('AUTHOR_CACHE_TTL', 300))
+)
+
+def resolve_authors(user_ids):
+    """Map user ids to {'name', 'email'} using the author cache and one batched users query"""
+    user_ids = {str(uid) for uid in user_ids if uid}
+    authors = author_cache.get_many(user_ids)
+    missing = [uid for uid in user_ids if uid not in authors]
+    if missing:
+        try:
+            result = supabase.table('users').select('id, name, email').in_('id', missing).execute()
+            fetched = {str(row['id']): {'name': row.get('name'), 'email': row.get('email')} for row in result.data}
+            # Cache misses too so unknown authors don't trigger a lookup on every request
+            for uid in missing:
+                fetched.setdefault(uid, {})
+            author_cache.set_many(fetched)
+            authors.update(fetched)
+        except Exception as e:
+            logging.warning(f'Author lookup failed: {e}')
+    return authors
+
+def author_display_name(user_info, default):
+    return user_info.get('name') or (user_info.get('email', '').split('@')[0] if user_info.get('email') else default)
+
+def get_recipe_change_version():
+    """Latest recipe_notifications id; changes whenever a recipe is created, updated or deleted"""
+    result = supabase.table('recipe_notifications').select('id').order('id', desc=True).limit(1).execute()
+    return result.data[0]['id'] if result.data else 0
+
+# Formatted discover feeds (full and summary view), rebuilt when recipe_notifications advances
+discover_feed_cache = VersionedCache(
+    get_recipe_change_version,
+    check_interval=int(os.getenv('DISCOVER_FEED_CHECK_INTERVAL', 15)),
+    max_age=int(os.getenv('DISCOVER_FEED_MAX_AGE', 300))
+)
+discover_summary_cache = VersionedCache(
+    get_recipe_change_version,
+    check_interval=int(os.getenv('DISCOVER_FEED_CHECK_INTERVAL', 15)),
+    max_age=int(os.getenv('DISCOVER_FEED_MAX_AGE', 300))
+)
+
+# Recipe indexes: full-text search over admin recipes and public user recipes, and an
+# ingredient index for "cook with what I have". Both are loaded once per worker and then kept
+# current from recipe_notifications, which this app, its other workers and the admin app all
+# write to, so only changed recipes are ever re-read.
+RECIPE_SEARCH_FIELDS = {'title': 3, 'tags': 2, 'ingredients': 1}
+SEARCH_SYNC_INTERVAL = int(os.getenv('SEARCH_SYNC_INTERVAL', 5))
+SEARCH_SYNC_BATCH = 500
+SEARCH_LOAD_PAGE_SIZE = 1000
+MAX_SEARCH_QUERY_LENGTH = 200
+MAX_MATCH_INGREDIENTS = 100
+recipe_search_index = SearchIndex(RECIPE_SEARCH_FIELDS)
+recipe_ingredient_index = IngredientIndex()
+# version: last recipe_notifications id applied (None until loaded); changed: this worker's
+# own writes, applied on the next query without waiting for the sync interval
+recipe_index_state = {'version': None, 'synced_at': 0.0, 'changed': set()}
+recipe_index_lock = threading.Lock()
+
+def recipe_index_key(recipe_type, recipe_id):
+    """Index key of a recipe; the same id the discover feed and /api/recipes/details use"""
+    return f'admin_{recipe_id}' if recipe_type == 'admin_recipe' else str(recipe_id)
+
+def recipe_is_published(recipe_type, recipe):
+    return recipe_type == 'admin_recipe' and (recipe.get('status') or 'published').lower() == 'published'
+
+def recipe_search_document(recipe_type, recipe):
+    """Searchable text of a recipe row, or None if it shouldn't be found by search"""
+    if recipe_type == 'admin_recipe':
+        if not recipe_is_published(recipe_type, recipe):
+            return None
+        tags = [recipe.get('category')]
+    else:
+        if not recipe.get('is_public'):
+            return None
+        tags = recipe.get('tags') or []
+    return {
+        'title': recipe.get('title'),
+        'tags': tags if isinstance(tags, list) else [tags],
+        'ingredients': [entry['name'] for entry in recipe_ingredients(recipe)]
+    }
+
+def recipe_match_document(recipe_type, recipe):
+    """(ingredient names, owner) for the ingredient index, or None if the recipe isn't matched.
+
+    Private user recipes are indexed for their owner only.
+    """
+    if recipe_type == 'admin_recipe':
+        if not recipe_is_published(recipe_type, recipe):
+            return None
+        owner = None
+    else:
+        owner = None if recipe.get('is_public') else str(recipe.get('user_id'))
+    return [entry['name'] for entry in recipe_ingredients(recipe)], owner
+
+def index_recipe(recipe_type, recipe_id, recipe):
+    """Update both indexes for one recipe row; recipe None means it was deleted"""
+    key = recipe_index_key(recipe_type, recipe_id)
+    document = recipe_search_document(recipe_type, recipe) if recipe is not None else None
+    if document is None:
+        recipe_search_index.remove(key)
+    else:
+        recipe_search_index.add(key, document)
+    match = recipe_match_document(recipe_type, recipe) if recipe is not None else None
+    if match is None:
+        recipe_ingredient_index.remove(key)
+    else:
+        recipe_ingredient_index.add(key, *match)
+
+def load_indexed_recipes():
+    """(recipe_type, recipe) for every recipe, read in id order one page at a time"""
+    for table, recipe_type in (('admin_recipes', 'admin_recipe'), ('recipes', 'user_recipe')):
+        last_id = None
+        while True:
+            query = supabase.table(table).select('*').order('id').limit(SEARCH_LOAD_PAGE_SIZE)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            rows = query.execute().data
+            for recipe in rows:
+                yield recipe_type, recipe
+            if len(rows) < SEARCH_LOAD_PAGE_SIZE:
+                break
+            last_id = rows[-1]['id']
+
+def rebuild_recipe_indexes():
+    search_documents, match_documents = [], []
+    for recipe_type, recipe in load_indexed_recipes():
+        key = recipe_index_key(recipe_type, recipe['id'])
+        document = recipe_search_document(recipe_type, recipe)
+        if document is not None:
+            search_documents.append((key, document))
+        match = recipe_match_document(recipe_type, recipe)
+        if match is not None:
+            match_documents.append((key, *match))
+    recipe_search_index.rebuild(search_documents)
+    recipe_ingredient_index.rebuild(match_documents)
+    logging.info(f'Recipe indexes loaded: {len(recipe_search_index)} searchable, {len(recipe_ingredient_index)} by ingredient')
+
+def refresh_recipe_indexes(changes):
+    """Re-read the recipes in changes, a set of (recipe_type, recipe_id), and update the indexes"""
+    for table, recipe_type in (('admin_recipes', 'admin_recipe'), ('recipes', 'user_recipe')):
+        ids = sorted(recipe_id for kind, recipe_id in changes if kind == recipe_type)
+        for start in range(0, len(ids), SEARCH_SYNC_BATCH):
+            chunk = ids[start:start + SEARCH_SYNC_BATCH]
+            rows = supabase.table(table).select('*').in_('id', chunk).execute().data
+            found = {str(recipe['id']): recipe for recipe in rows}
+            for recipe_id in chunk:
+                index_recipe(recipe_type, recipe_id, found.get(recipe_id))
+
+def sync_recipe_indexes():
+    """Bring the recipe indexes up to date; returns False if they have never been loaded"""
+    state = recipe_index_state
+    if (state['version'] is not None and not state['changed']
+            and time.monotonic() - state['synced_at'] < SEARCH_SYNC_INTERVAL):
+        return True
+
+    # One thread syncs; the others wait and then find the indexes current
+    with recipe_index_lock:
+        if (state['version'] is not None and not state['changed']
+                and time.monotonic() - state['synced_at'] < SEARCH_SYNC_INTERVAL):
+            return True
+        # Writers may still add to the old set; anything missed is in recipe_notifications too
+        pending, state['changed'] = state['changed'], set()
+        changes = set(pending)
+        try:
+            if state['version'] is not None:
+                notifications = supabase.table('recipe_notifications').select('id, type, recipe_id, data') \
+                    .gt('id', state['version']).order('id').limit(SEARCH_SYNC_BATCH).execute().data
+                if len(notifications) < SEARCH_SYNC_BATCH:
+                    for notification in notifications:
+                        recipe_id = (notification.get('data') or {}).get('recipe_id') or notification.get('recipe_id')
+                        if notification.get('type') in ('admin_recipe', 'user_recipe') and recipe_id is not None:
+                            changes.add((notification['type'], str(recipe_id)))
+                    refresh_recipe_indexes(changes)
+                    if notifications:
+                        state['version'] = notifications[-1]['id']
+                    state['synced_at'] = time.monotonic()
+                    return True
+                logging.info('Recipe indexes are far behind, reloading them')
+
+            # Read the version first so changes made during the load are picked up next time
+            version = get_recipe_change_version()
+            rebuild_recipe_indexes()
+            state['version'] = version
+            state['synced_at'] = time.monotonic()
+        except Exception as e:
+            logging.warning(f'Recipe index sync failed: {e}')
+            state['changed'] |= changes
+            # Don't retry on every request while the database is failing
+            state['synced_at'] = time.monotonic()
+        return state['version'] is not None
+
+def notify_recipe_change(recipe_type, action, recipe_id=None, recipe_title=None):
+    """Drop this worker's discover feeds and record the change so other workers refresh too"""
+    discover_feed_cache.invalidate()
+    discover_summary_cache.invalidate()
+    if recipe_id is not None:
+        recipe_index_state['changed'].add((recipe_type, str(recipe_id)))
+    try:
+        supabase.table('recipe_notifications').insert({
+            'type': recipe_type,
+            'action': action,
+            # recipe_id is an integer column; user recipe ids are UUIDs and go in data
+            'recipe_id': recipe_id if recipe_type == 'admin_recipe' else None,
+            'recipe_title': recipe_title,
+            'data': {'recipe_id': str(recipe_id)} if recipe_id is not None else {},
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }).execute()
+    except Exception as e:
+        logging.warning(f'Recipe change notification failed: {e}')
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'ok', 'message': 'Flask backend is running'}), 200
+    return jsonify({'status': 'ok', 'message': 'Flask backend is running', 'analytics': analytics_writer.stats()}), 200
 
 @app.route('/api/setup-database', methods=['POST'])
 def setup_database():
@@ -113,12 +445,13 @@ def setup_database():
         return jsonify({'error': f'Database setup failed: {str(e)}'}), 500
 
 @app.route('/api/auth/register', methods=['POST', 'OPTIONS'])
+@validate_body(CREDENTIALS)
 def register():
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        data = request.get_json()
+        data = request_body()
         email = data.get('email')
         password = data.get('password')
         
@@ -135,7 +468,7 @@ def register():
             return jsonify({'error': 'User already exists'}), 409
         
         # Hash password and create user
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
         user_data = {
             'email': email,
             'password_hash': hashed_password,
@@ -164,12 +497,13 @@ def register():
         return jsonify({'error': 'Registration failed'}), 500
 
 @app.route('/api/auth/login', methods=['POST', 'OPTIONS'])
+@validate_body(CREDENTIALS)
 def login():
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        data = request.get_json()
+        data = request_body()
         email = data.get('email')
         password = data.get('password')
         
@@ -185,9 +519,11 @@ def login():
         user = user_result.data[0]
         
         # Verify password
-        if not check_password_hash(user['password_hash'], password):
+        if not verify_password(user['password_hash'], password):
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        upgrade_password_hash('users', user['id'], user['password_hash'], password)
+        
         # Update last login time
         supabase.table('users').update({
             'updated_at': datetime.now(timezone.utc).isoformat()
@@ -221,22 +557,12 @@ def verify_token():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         
         # Get full user data
-        user_result = supabase.table('users').select('*').eq('id', payload['user_id']).execute()
-        if user_result.data:
-            user = user_result.data[0]
-            return jsonify({
-                'user': {
-                    'id': user['id'], 
-                    'email': user['email'], 
-                    'name': user.get('name'),
-                    'phone': user.get('phone'),
-                    'location': user.get('location'),
-                    'bio': user.get('bio')
-                }
-            }), 200
+        user = get_user_profile(payload['user_id'])
+        if user:
+            return jsonify({'user': format_user_profile(user)}), 200
         
         return jsonify({'user': {'id': payload['user_id'], 'email': payload['email']}}), 200
         
@@ -246,6 +572,7 @@ def verify_token():
         return jsonify({'error': 'Invalid token'}), 401
 
 @app.route('/api/profile/update', methods=['PUT', 'OPTIONS'])
+@validate_body(PROFILE_UPDATE, authenticate=user_token_error)
 def update_profile():
     if request.method == 'OPTIONS':
         return '', 200
@@ -256,10 +583,10 @@ def update_profile():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
-        data = request.get_json()
+        data = request_body()
         
         # Update user profile
         update_data = {
@@ -274,20 +601,17 @@ def update_profile():
         update_data = {k: v for k, v in update_data.items() if v is not None}
         
         result = supabase.table('users').update(update_data).eq('id', user_id).execute()
+        author_cache.delete(str(user_id))
         
         if result.data:
             user = result.data[0]
+            # Write-through: the verify endpoint sees the new profile immediately
+            cache_profile(user_id, format_user_profile(user))
             return jsonify({
                 'message': 'Profile updated successfully',
-                'user': {
-                    'id': user['id'],
-                    'email': user['email'],
-                    'name': user.get('name'),
-                    'phone': user.get('phone'),
-                    'location': user.get('location'),
-                    'bio': user.get('bio')
-                }
+                'user': format_user_profile(user)
             }), 200
+        invalidate_profile(user_id)
         
     except jwt.ExpiredSignatureError:
         return jsonify({'error': 'Token expired'}), 401
@@ -299,6 +623,7 @@ def update_profile():
 
 @app.route('/api/recipes', methods=['GET', 'POST', 'OPTIONS'])
 @track_usage('recipe_action')
+@validate_body({'POST': RECIPE}, authenticate=user_token_error)
 def recipes():
     if request.method == 'OPTIONS':
         return '', 200
@@ -309,17 +634,21 @@ def recipes():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         if request.method == 'GET':
             # Get user's recipes
-            result = supabase.table('recipes').select('*').eq('user_id', user_id).execute()
-            return jsonify({'recipes': result.data}), 200
+            def build():
+                result = supabase.table('recipes').select('*').eq('user_id', user_id).execute()
+                return jsonify({'recipes': result.data}), 200
+            
+            etag = user_rows_etag(supabase.table('recipes').select('id, updated_at').eq('user_id', user_id))
+            return conditional_response(etag, build)
         
         elif request.method == 'POST':
             # Create new recipe
-            data = request.get_json()
+            data = request_body()
             
             if not data:
                 return jsonify({'error': 'No data provided'}), 400
@@ -344,9 +673,10 @@ def recipes():
             }
             
             try:
-                result = supabase.table('recipes').insert(recipe_data).execute()
+                result = execute_recipe_write(lambda row: supabase.table('recipes').insert(row), recipe_data)
                 
                 if result.data:
+                    notify_recipe_change('user_recipe', 'create', result.data[0]['id'], title)
                     return jsonify({
                         'message': 'Recipe created successfully',
                         'recipe': result.data[0]
@@ -363,10 +693,11 @@ def recipes():
         return jsonify({'error': 'Invalid token'}), 401
     except Exception as e:
         logging.error(f'Recipe operation error: {str(e)}')
-        logging.error(f'Request data: {request.get_json() if request.method == "POST" else "N/A"}')
+        logging.error(f'Request data: {request_body() if request.method == "POST" else "N/A"}')
         return jsonify({'error': f'Recipe operation failed: {str(e)}'}), 500
 
 @app.route('/api/recipes/<recipe_id>', methods=['PUT', 'DELETE', 'OPTIONS'])
+@validate_body({'PUT': RECIPE}, authenticate=user_token_error)
 def recipe_detail(recipe_id):
     if request.method == 'OPTIONS':
         return '', 200
@@ -377,12 +708,12 @@ def recipe_detail(recipe_id):
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         if request.method == 'PUT':
             # Update recipe
-            data = request.get_json()
+            data = request_body()
             
             update_data = {
                 'title': data.get('title'),
@@ -400,9 +731,10 @@ def recipe_detail(recipe_id):
             # Remove None values
             update_data = {k: v for k, v in update_data.items() if v is not None}
             
-            result = supabase.table('recipes').update(update_data).eq('id', recipe_id).eq('user_id', user_id).execute()
+            result = execute_recipe_write(lambda row: supabase.table('recipes').update(row).eq('id', recipe_id).eq('user_id', user_id), update_data)
             
             if result.data:
+                notify_recipe_change('user_recipe', 'update', recipe_id, result.data[0].get('title'))
                 return jsonify({
                     'message': 'Recipe updated successfully',
                     'recipe': result.data[0]
@@ -411,6 +743,8 @@ def recipe_detail(recipe_id):
         elif request.method == 'DELETE':
             # Delete recipe
             result = supabase.table('recipes').delete().eq('id', recipe_id).eq('user_id', user_id).execute()
+            if result.data:
+                notify_recipe_change('user_recipe', 'delete', recipe_id, result.data[0].get('title'))
             
             return jsonify({'message': 'Recipe deleted successfully'}), 200
         
@@ -433,7 +767,7 @@ def track_recipe_access(recipe_id):
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         # Track recipe access
@@ -467,12 +801,16 @@ def get_user_saved_recipes():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         try:
             # Get user's saved recipes with recipe details
-            result = supabase.table('user_recipes').select('*, recipes(*)').eq('user_id', user_id).eq('is_saved', True).execute()
+            if wants_full_view():
+                columns = '*, recipes(*)'
+            else:
+                columns = f'{USER_RECIPE_SUMMARY_COLUMNS}, recipes({RECIPE_SUMMARY_COLUMNS})'
+            result = supabase.table('user_recipes').select(columns).eq('user_id', user_id).eq('is_saved', True).execute()
             return jsonify({'saved_recipes': result.data}), 200
         except Exception as db_error:
             logging.warning(f'user_recipes table not found: {db_error}')
@@ -489,6 +827,7 @@ def get_user_saved_recipes():
 
 @app.route('/api/recipes/<recipe_id>/save', methods=['POST', 'DELETE', 'OPTIONS'])
 @track_usage('recipe_save_action')
+@validate_body({'POST': SAVED_RECIPE}, authenticate=user_token_error)
 def save_recipe(recipe_id):
     logging.info(f'Save recipe endpoint called: {request.method} /api/recipes/{recipe_id}/save')
     if request.method == 'OPTIONS':
@@ -500,13 +839,13 @@ def save_recipe(recipe_id):
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         try:
             if request.method == 'POST':
                 # Get recipe data from request body if provided
-                data = request.get_json() or {}
+                data = request_body()
                 logging.info(f'Request data: {data}')
                 
                 # Save recipe
@@ -582,7 +921,7 @@ def get_recipes():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         # Get user's recipes
@@ -599,6 +938,7 @@ def get_recipes():
         return jsonify({'error': 'Failed to get recipes'}), 500
 
 @app.route('/api/recipes', methods=['POST'])
+@validate_body(RECIPE, authenticate=user_token_error)
 def create_recipe():
     try:
         token = request.headers.get('Authorization', '').replace('Bearer ', '')
@@ -606,10 +946,10 @@ def create_recipe():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
-        data = request.get_json()
+        data = request_body()
         
         # Validate required fields
         if not data.get('name'):
@@ -641,9 +981,10 @@ def create_recipe():
         }
         
         # Insert recipe
-        result = supabase.table('recipes').insert(recipe_data).execute()
+        result = execute_recipe_write(lambda row: supabase.table('recipes').insert(row), recipe_data)
         
         if result.data:
+            notify_recipe_change('user_recipe', 'create', result.data[0]['id'], recipe_data['title'])
             return jsonify({'message': 'Recipe created successfully', 'recipe': result.data[0]}), 201
         else:
             return jsonify({'error': 'Failed to create recipe'}), 500
@@ -664,7 +1005,7 @@ def delete_recipe(recipe_id):
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         # Check if recipe exists and belongs to user
@@ -675,6 +1016,7 @@ def delete_recipe(recipe_id):
         
         # Delete recipe
         result = supabase.table('recipes').delete().eq('id', recipe_id).eq('user_id', user_id).execute()
+        notify_recipe_change('user_recipe', 'delete', recipe_id, check_result.data[0].get('title'))
         
         return jsonify({'message': 'Recipe deleted successfully'}), 200
         
@@ -687,6 +1029,7 @@ def delete_recipe(recipe_id):
         return jsonify({'error': 'Failed to delete recipe'}), 500
 
 @app.route('/api/saved-recipes', methods=['GET', 'POST', 'DELETE', 'OPTIONS'])
+@validate_body({'POST': SAVED_RECIPE}, authenticate=user_token_error)
 def manage_saved_recipes():
     if request.method == 'OPTIONS':
         return '', 200
@@ -696,7 +1039,7 @@ def manage_saved_recipes():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         if request.method == 'GET':
@@ -706,7 +1049,7 @@ def manage_saved_recipes():
             
         elif request.method == 'POST':
             # Save a recipe
-            data = request.get_json()
+            data = request_body()
             recipe_id = data.get('recipe_id')
             recipe_data = data.get('recipe_data', {})
             
@@ -756,113 +1099,431 @@ def get_recipe_details(recipe_id):
         recipe = recipe_result.data[0]
         
         # Get user info
-        user_info = {}
-        try:
-            user_result = supabase.table('users').select('name, email').eq('id', recipe['user_id']).execute()
-            if user_result.data:
-                user_info = user_result.data[0]
-        except:
-            pass
-        
-        time_display = "30 min"  # Always show default time
-        
-        formatted_recipe = {
-            'id': recipe['id'],
-            'name': recipe.get('title', 'Untitled Recipe'),
-            'title': recipe.get('title', 'Untitled Recipe'),
-            'time': time_display,
-            'servings': recipe.get('servings', 1),
-            'image': recipe.get('image', '🍽️'),
-            'ingredients': recipe.get('ingredients', []),
-            'instructions': recipe.get('instructions', []),
-            'difficulty': recipe.get('difficulty', 'medium'),
-            'tags': recipe.get('tags', []),
-            'author': user_info.get('name') or (user_info.get('email', '').split('@')[0] if user_info.get('email') else 'Anonymous'),
-            'created_at': recipe.get('created_at')
-        }
+        user_info = resolve_authors([recipe.get('user_id')]).get(str(recipe.get('user_id')), {})
         
-        return jsonify({'recipe': formatted_recipe}), 200
+        return jsonify({'recipe': format_recipe_details(recipe, user_info)}), 200
         
     except Exception as e:
         logging.error(f'Get recipe details error: {e}')
         return jsonify({'error': 'Failed to get recipe details'}), 500
 
-@app.route('/api/discover/recipes', methods=['GET', 'OPTIONS'])
-def get_discover_recipes():
+@app.route('/api/ingredients/parse', methods=['POST', 'OPTIONS'])
+@validate_body(INGREDIENT_LINES)
+def parse_ingredient_lines():
+    """Parse ingredient lines into quantity, unit and name"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    # INGREDIENT_LINES has already checked the list and its length
+    return jsonify({'ingredients': parse_ingredients(request_body()['ingredients'])}), 200
+
+def format_recipe_details(recipe, user_info):
+    time_display = "30 min"  # Always show default time
+    
+    return {
+        'id': recipe['id'],
+        'name': recipe.get('title', 'Untitled Recipe'),
+        'title': recipe.get('title', 'Untitled Recipe'),
+        'time': time_display,
+        'servings': recipe.get('servings', 1),
+        'image': recipe.get('image', '🍽️'),
+        'ingredients': recipe.get('ingredients', []),
+        'instructions': recipe.get('instructions', []),
+        'difficulty': recipe.get('difficulty', 'medium'),
+        'tags': recipe.get('tags', []),
+        'author': author_display_name(user_info, 'Anonymous'),
+        'created_at': recipe.get('created_at')
+    }
+
+UUID_PATTERN = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+@app.route('/api/recipes/details', methods=['GET', 'OPTIONS'])
+def get_recipe_details_batch():
+    """Full details for many recipes (user or admin_<id>) in one request.
+
+    Both kinds use the discover feed formatters, so each entry matches the ?view=full
+    feed entry it expands (same author style, is_admin_recipe on both).
+    """
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        # Get admin recipes first
-        admin_recipes = []
-        try:
-            admin_result = supabase.table('admin_recipes').select('*').order('created_at', desc=True).execute()
+        ids = [i.strip() for i in request.args.get('ids', '').split(',') if i.strip()]
+        ids = list(dict.fromkeys(ids))
+        
+        if not ids:
+            return jsonify({'error': 'Recipe ids required'}), 400
+        if len(ids) > MAX_DETAIL_IDS:
+            return jsonify({'error': f'At most {MAX_DETAIL_IDS} ids per request'}), 400
+        
+        admin_ids = [i[len('admin_'):] for i in ids if i.startswith('admin_') and i[len('admin_'):].isdigit()]
+        user_ids = [i for i in ids if UUID_PATTERN.match(i)]
+        
+        found = {}
+        if admin_ids:
+            admin_result = supabase.table('admin_recipes').select('*').in_('id', admin_ids).execute()
             for recipe in admin_result.data:
-                formatted_recipe = {
-                    'id': f"admin_{recipe['id']}",
-                    'name': recipe.get('title', 'Untitled Recipe'),
-                    'title': recipe.get('title', 'Untitled Recipe'),
-                    'time': f"{recipe.get('cook_time', 30)} min",
-                    'servings': recipe.get('servings', 1),
-                    'image': recipe.get('image', '🍽️'),
-                    'ingredients': recipe.get('ingredients', []),
-                    'instructions': recipe.get('instructions', []),
-                    'difficulty': recipe.get('difficulty', 'medium'),
-                    'tags': recipe.get('tags', []),
-                    'author': 'By Admin',
-                    'is_admin_recipe': True,
-                    'created_at': recipe.get('created_at')
-                }
-                admin_recipes.append(formatted_recipe)
-        except Exception as admin_error:
-            logging.warning(f'Failed to get admin recipes: {admin_error}')
+                formatted = format_admin_discover_recipe(recipe)
+                found[formatted['id']] = formatted
         
-        # Get user recipes
-        user_recipes = []
-        try:
-            recipes_result = supabase.table('recipes').select('*').order('created_at', desc=True).limit(30).execute()
-            
+        if user_ids:
+            recipes_result = supabase.table('recipes').select('*').in_('id', user_ids).execute()
+            authors = resolve_authors(recipe.get('user_id') for recipe in recipes_result.data)
             for recipe in recipes_result.data:
-                # Get user info separately
-                user_info = {}
-                try:
-                    user_result = supabase.table('users').select('name, email').eq('id', recipe['user_id']).execute()
-                    if user_result.data:
-                        user_info = user_result.data[0]
-                except:
-                    pass
-                
-                time_display = "30 min"  # Always show default time
-                
-                formatted_recipe = {
-                    'id': recipe['id'],
-                    'name': recipe.get('title', 'Untitled Recipe'),
-                    'title': recipe.get('title', 'Untitled Recipe'),
-                    'time': time_display,
-                    'servings': recipe.get('servings', 1),
-                    'image': recipe.get('image', '🍽️'),
-                    'ingredients': recipe.get('ingredients', []),
-                    'instructions': recipe.get('instructions', []),
-                    'difficulty': recipe.get('difficulty', 'medium'),
-                    'tags': recipe.get('tags', []),
-                    'author': f"By {user_info.get('name') or (user_info.get('email', '').split('@')[0] if user_info.get('email') else 'You')}",
-                    'is_admin_recipe': False,
-                    'created_at': recipe.get('created_at')
-                }
-                user_recipes.append(formatted_recipe)
-        except Exception as user_error:
-            logging.warning(f'Failed to get user recipes: {user_error}')
+                found[str(recipe['id'])] = format_user_discover_recipe(recipe, authors.get(str(recipe.get('user_id')), {}))
         
-        # Combine admin recipes first, then user recipes
-        all_recipes = admin_recipes + user_recipes
+        return jsonify({
+            'recipes': [found[i] for i in ids if i in found],
+            'missing': [i for i in ids if i not in found]
+        }), 200
         
-        return jsonify({'recipes': all_recipes}), 200
+    except Exception as e:
+        logging.error(f'Get recipe details batch error: {e}')
+        return jsonify({'error': 'Failed to get recipe details'}), 500
+
+def recipe_summaries(keys, viewer=None):
+    """Summary view of recipes by index key; the indexes only hold keys, so a page of hits is read back here.
+
+    Visibility is checked again on the read, so a recipe unpublished or made private since
+    the last sync is dropped; viewer's own private recipes are kept.
+    """
+    admin_ids = [key[len('admin_'):] for key in keys if key.startswith('admin_')]
+    user_ids = [key for key in keys if not key.startswith('admin_')]
+    found = {}
+    if admin_ids:
+        admin_result = supabase.table('admin_recipes').select(ADMIN_RECIPE_SUMMARY_COLUMNS).in_('id', admin_ids) \
+            .or_('status.is.null,status.ilike.published').execute()
+        for recipe in admin_result.data:
+            formatted = format_admin_discover_recipe(recipe, full=False)
+            found[formatted['id']] = formatted
+    if user_ids:
+        query = supabase.table('recipes').select(RECIPE_SUMMARY_COLUMNS).in_('id', user_ids)
+        if viewer:
+            query = query.or_(f'is_public.is.true,user_id.eq.{viewer}')
+        else:
+            query = query.eq('is_public', True)
+        recipes_result = query.execute()
+        authors = resolve_authors(recipe.get('user_id') for recipe in recipes_result.data)
+        for recipe in recipes_result.data:
+            found[str(recipe['id'])] = format_user_discover_recipe(recipe, authors.get(str(recipe.get('user_id')), {}), full=False)
+    return found
+
+@app.route('/api/recipes/search', methods=['GET', 'OPTIONS'])
+def search_recipes():
+    """Admin and public recipes ranked by how well their title, tags and ingredients match ?q="""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Search query required'}), 400
+        if len(query) > MAX_SEARCH_QUERY_LENGTH:
+            return jsonify({'error': f'Search query must be at most {MAX_SEARCH_QUERY_LENGTH} characters'}), 400
+        limit = parse_page_size(
+            request.args.get('limit'),
+            default=int(os.getenv('SEARCH_PAGE_SIZE', 20)),
+            maximum=int(os.getenv('SEARCH_MAX_PAGE_SIZE', 50))
+        )
+        
+        if not sync_recipe_indexes():
+            return jsonify({'error': 'Search is temporarily unavailable'}), 503
+        hits = recipe_search_index.search(query, limit)
+        
+        found = recipe_summaries([key for key, _ in hits])
+        results = [dict(found[key], score=score) for key, score in hits if key in found]
+        return jsonify({'query': query, 'recipes': results, 'count': len(results)}), 200
+        
+    except Exception as e:
+        logging.error(f'Recipe search error: {e}')
+        return jsonify({'error': 'Failed to search recipes'}), 500
+
+@app.route('/api/recipes/match', methods=['GET', 'OPTIONS'])
+def match_recipes():
+    """Recipes ranked by how many of their ingredients the user has.
+
+    Ingredients come from ?ingredients=a,b,c and/or, with ?from_shopping=true, the
+    user's shopping list. The user's own private recipes are included.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        
+        if not token:
+            return jsonify({'error': 'Token required'}), 401
+        
+        payload = decode_token(token, JWT_SECRET)
+        user_id = payload['user_id']
+        
+        ingredients = [name.strip() for name in request.args.get('ingredients', '').split(',') if name.strip()]
+        if len(ingredients) > MAX_MATCH_INGREDIENTS:
+            return jsonify({'error': f'At most {MAX_MATCH_INGREDIENTS} ingredients per request'}), 400
+        if request.args.get('from_shopping', '').lower() in ('1', 'true', 'yes'):
+            items = supabase.table('shopping_items').select('item_name').eq('user_id', user_id) \
+                .order('created_at', desc=True).limit(MAX_MATCH_INGREDIENTS).execute()
+            ingredients.extend(item['item_name'] for item in items.data if item.get('item_name'))
+        ingredients = list(dict.fromkeys(ingredients))
+        
+        if not ingredients:
+            return jsonify({'error': 'Ingredients required'}), 400
+        limit = parse_page_size(
+            request.args.get('limit'),
+            default=int(os.getenv('SEARCH_PAGE_SIZE', 20)),
+            maximum=int(os.getenv('SEARCH_MAX_PAGE_SIZE', 50))
+        )
+        
+        if not sync_recipe_indexes():
+            return jsonify({'error': 'Recipe matching is temporarily unavailable'}), 503
+        matches = recipe_ingredient_index.match(ingredients, viewer=str(user_id), limit=limit)
+        
+        found = recipe_summaries([match['key'] for match in matches], viewer=str(user_id))
+        results = [dict(found[match['key']], coverage=match['coverage'], matched=match['matched'], missing=match['missing'])
+                   for match in matches if match['key'] in found]
+        return jsonify({'ingredients': ingredients, 'recipes': results, 'count': len(results)}), 200
+        
+    except jwt.ExpiredSignatureError:
+        return jsonify({'error': 'Token expired'}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({'error': 'Invalid token'}), 401
+    except Exception as e:
+        logging.error(f'Recipe match error: {e}')
+        return jsonify({'error': 'Failed to match recipes'}), 500
+
+def format_admin_discover_recipe(recipe, full=True):
+    formatted = {
+        'id': f"admin_{recipe['id']}",
+        'name': recipe.get('title', 'Untitled Recipe'),
+        'title': recipe.get('title', 'Untitled Recipe'),
+        'time': f"{recipe.get('cook_time', 30)} min",
+        'servings': recipe.get('servings', 1),
+        'image': recipe.get('image', '🍽️'),
+        'difficulty': recipe.get('difficulty', 'medium'),
+        'tags': recipe.get('tags', []),
+        'author': 'By Admin',
+        'is_admin_recipe': True,
+        'created_at': recipe.get('created_at')
+    }
+    if full:
+        formatted['ingredients'] = recipe.get('ingredients', [])
+        formatted['instructions'] = recipe.get('instructions', [])
+    return formatted
+
+def format_user_discover_recipe(recipe, user_info, full=True):
+    time_display = "30 min"  # Always show default time
+    
+    formatted = {
+        'id': recipe['id'],
+        'name': recipe.get('title', 'Untitled Recipe'),
+        'title': recipe.get('title', 'Untitled Recipe'),
+        'time': time_display,
+        'servings': recipe.get('servings', 1),
+        'image': recipe.get('image', '🍽️'),
+        'difficulty': recipe.get('difficulty', 'medium'),
+        'tags': recipe.get('tags', []),
+        'author': f"By {author_display_name(user_info, 'You')}",
+        'is_admin_recipe': False,
+        'created_at': recipe.get('created_at')
+    }
+    if full:
+        formatted['ingredients'] = recipe.get('ingredients', [])
+        formatted['instructions'] = recipe.get('instructions', [])
+    return formatted
+
+def build_discover_feed(full=True):
+    """Load and format the discover feed; 'complete' is False if a source failed"""
+    complete = True
+    admin_columns = '*' if full else ADMIN_RECIPE_SUMMARY_COLUMNS
+    recipe_columns = '*' if full else RECIPE_SUMMARY_COLUMNS
+    
+    # Get admin recipes first
+    admin_recipes = []
+    try:
+        admin_result = supabase.table('admin_recipes').select(admin_columns).order('created_at', desc=True).execute()
+        admin_recipes = [format_admin_discover_recipe(recipe, full) for recipe in admin_result.data]
+    except Exception as admin_error:
+        logging.warning(f'Failed to get admin recipes: {admin_error}')
+        complete = False
+    
+    # Get user recipes
+    user_recipes = []
+    try:
+        recipes_result = supabase.table('recipes').select(recipe_columns).order('created_at', desc=True).limit(30).execute()
+        
+        # Resolve all authors in one query instead of one per recipe
+        authors = resolve_authors(recipe.get('user_id') for recipe in recipes_result.data)
+        
+        for recipe in recipes_result.data:
+            user_info = authors.get(str(recipe.get('user_id')), {})
+            user_recipes.append(format_user_discover_recipe(recipe, user_info, full))
+    except Exception as user_error:
+        logging.warning(f'Failed to get user recipes: {user_error}')
+        complete = False
+    
+    # Combine admin recipes first, then user recipes
+    all_recipes = admin_recipes + user_recipes
+    
+    body = json_bytes(app, {'recipes': all_recipes})
+    return {
+        'recipes': all_recipes,
+        'body': body,
+        'complete': complete,
+        # Hashed once per rebuild; a partial feed gets no ETag so clients refetch it
+        'etag': hashlib.sha1(body).hexdigest() if complete else None
+    }
+
+def fetch_keyset_page(table, after, limit, columns='*'):
+    """Fetch up to limit rows ordered by (created_at, id) descending that sort strictly after the given key"""
+    query = supabase.table(table).select(columns).order('created_at', desc=True).order('id', desc=True).limit(limit)
+    if after:
+        created_at, row_id = after
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id})')
+    return query.execute().data
+
+def created_at_key(value):
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return datetime.min.replace(tzinfo=timezone.utc)
+
+DISCOVER_SOURCES = (('admin', 'admin_recipes'), ('user', 'recipes'))
+DISCOVER_SUMMARY_COLUMNS = {'admin_recipes': ADMIN_RECIPE_SUMMARY_COLUMNS, 'recipes': RECIPE_SUMMARY_COLUMNS}
+
+def validate_keyset_position(after):
+    """Reject cursor positions that could not have come from build_discover_page"""
+    if after is None:
+        return
+    if not isinstance(after, list) or len(after) != 2:
+        raise ValueError('Invalid cursor')
+    created_at, row_id = after
+    datetime.fromisoformat(str(created_at).replace('Z', '+00:00'))
+    if not re.fullmatch(r'[0-9A-Za-z-]+', str(row_id)):
+        raise ValueError('Invalid cursor')
+
+def build_discover_page(cursor_state, limit, full=True):
+    """Merge one page from the admin and user recipe streams by created_at (newest first)"""
+    streams = {}
+    for source, table in DISCOVER_SOURCES:
+        source_state = cursor_state.get(source) or {}
+        if not isinstance(source_state, dict):
+            raise ValueError('Invalid cursor')
+        validate_keyset_position(source_state.get('after'))
+        if source_state.get('done'):
+            streams[source] = []
+        else:
+            columns = '*' if full else DISCOVER_SUMMARY_COLUMNS[table]
+            streams[source] = fetch_keyset_page(table, source_state.get('after'), limit, columns)
+    
+    # Each stream is already sorted by the database, so a k-way merge is enough;
+    # the source rank keeps ids of different types from being compared
+    merged = heapq.merge(
+        *[[(source, row) for row in streams[source]] for source, _ in DISCOVER_SOURCES],
+        key=lambda item: (created_at_key(item[1].get('created_at')), item[0] == 'admin', item[1]['id']),
+        reverse=True
+    )
+    page = list(islice(merged, limit))
+    
+    next_state = {}
+    for source, _ in DISCOVER_SOURCES:
+        source_state = cursor_state.get(source) or {}
+        consumed = [row for row_source, row in page if row_source == source]
+        after = [consumed[-1].get('created_at'), consumed[-1]['id']] if consumed else source_state.get('after')
+        # A short read that was fully consumed means the stream has nothing left
+        done = source_state.get('done', False) or (len(streams[source]) < limit and len(consumed) == len(streams[source]))
+        next_state[source] = {'after': after, 'done': done}
+    
+    authors = resolve_authors(row.get('user_id') for source, row in page if source == 'user')
+    recipes = []
+    for source, row in page:
+        if source == 'admin':
+            recipes.append(format_admin_discover_recipe(row, full))
+        else:
+            recipes.append(format_user_discover_recipe(row, authors.get(str(row.get('user_id')), {}), full))
+    
+    has_more = not all(state['done'] for state in next_state.values())
+    return {
+        'recipes': recipes,
+        'next_cursor': encode_cursor(next_state) if has_more else None,
+        'has_more': has_more
+    }
+
+@app.route('/api/discover/recipes', methods=['GET', 'OPTIONS'])
+def get_discover_recipes():
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        # Infinite-scroll mode: bounded pages with an opaque cursor
+        if 'cursor' in request.args or 'limit' in request.args:
+            cursor = request.args.get('cursor')
+            limit = parse_page_size(
+                request.args.get('limit'),
+                default=int(os.getenv('DISCOVER_PAGE_SIZE', 20)),
+                maximum=int(os.getenv('DISCOVER_MAX_PAGE_SIZE', 50))
+            )
+            try:
+                cursor_state = decode_cursor(cursor) if cursor else {}
+                page = build_discover_page(cursor_state, limit, wants_full_view())
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            
+            return jsonify(page), 200
+        
+        full = wants_full_view()
+        feed_cache = discover_feed_cache if full else discover_summary_cache
+        feed = feed_cache.get(lambda: build_discover_feed(full))
+        if not feed['complete']:
+            # Serve the partial feed once but don't keep it around
+            feed_cache.invalidate()
+        
+        return conditional_response(feed.get('etag'), lambda: app.response_class(feed['body'], status=200, mimetype='application/json'))
         
     except Exception as e:
         logging.error(f'Get discover recipes error: {e}')
         return jsonify({'error': 'Failed to get recipes'}), 500
 
+def add_shopping_items(user_id, items):
+    """Insert shopping items and upsert their recent_items entries in one round trip"""
+    items = [{
+        'item_name': item['item_name'],
+        'category': item.get('category', 'Other'),
+        'quantity': item.get('quantity', 1),
+        'unit': item.get('unit', 'pcs')
+    } for item in items]
+    
+    try:
+        return supabase.rpc('add_shopping_items', {'p_user_id': user_id, 'p_items': items}).execute().data
+    except Exception as rpc_error:
+        # Anything but a missing function may have committed already; retrying would add the items twice
+        if not is_missing_function(rpc_error):
+            raise
+        logging.warning(f'add_shopping_items RPC unavailable, adding in steps: {rpc_error}')
+    
+    result = supabase.table('shopping_items').insert([dict(item, user_id=user_id) for item in items]).execute()
+    
+    # Update recent items
+    for item in items:
+        recent_result = supabase.table('recent_items').select('*').eq('user_id', user_id).ilike('item_name', item['item_name']).execute()
+        
+        if recent_result.data:
+            recent_item = recent_result.data[0]
+            supabase.table('recent_items').update({
+                'frequency': recent_item['frequency'] + 1,
+                'last_used': datetime.now(timezone.utc).isoformat()
+            }).eq('id', recent_item['id']).execute()
+        else:
+            supabase.table('recent_items').insert({
+                'user_id': user_id,
+                'item_name': item['item_name'],
+                'category': item['category']
+            }).execute()
+    
+    return result.data
+
 @app.route('/api/shopping/items', methods=['GET', 'POST', 'OPTIONS'])
+@validate_body({'POST': SHOPPING_ITEM}, authenticate=user_token_error)
 def shopping_items():
     if request.method == 'OPTIONS':
         return '', 200
@@ -872,15 +1533,19 @@ def shopping_items():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         if request.method == 'GET':
-            result = supabase.table('shopping_items').select('*').eq('user_id', user_id).order('created_at', desc=True).execute()
-            return jsonify({'items': result.data}), 200
+            def build():
+                result = supabase.table('shopping_items').select('*').eq('user_id', user_id).order('created_at', desc=True).execute()
+                return jsonify({'items': result.data}), 200
+            
+            etag = user_rows_etag(supabase.table('shopping_items').select('id, updated_at').eq('user_id', user_id))
+            return conditional_response(etag, build)
             
         elif request.method == 'POST':
-            data = request.get_json()
+            data = request_body()
             item_name = data.get('item_name')
             category = data.get('category', 'Other')
             quantity = data.get('quantity', 1)
@@ -897,27 +1562,123 @@ def shopping_items():
                 'unit': unit
             }
             
-            result = supabase.table('shopping_items').insert(item_data).execute()
+            items = add_shopping_items(user_id, [item_data])
             
-            # Update recent items
-            recent_result = supabase.table('recent_items').select('*').eq('user_id', user_id).ilike('item_name', item_name).execute()
+            return jsonify({'message': 'Item added successfully', 'item': items[0]}), 201
             
-            if recent_result.data:
-                recent_item = recent_result.data[0]
-                supabase.table('recent_items').update({
-                    'frequency': recent_item['frequency'] + 1,
-                    'last_used': datetime.now(timezone.utc).isoformat()
-                }).eq('id', recent_item['id']).execute()
+    except jwt.ExpiredSignatureError:
+        return jsonify({'error': 'Token expired'}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({'error': 'Invalid token'}), 401
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+SHOPPING_ITEM_UPDATE_FIELDS = ('is_completed', 'quantity')
+
+@app.route('/api/shopping/items/bulk', methods=['POST', 'OPTIONS'])
+@validate_body(SHOPPING_BULK, authenticate=user_token_error)
+def bulk_shopping_items():
+    """Apply many add/update/delete operations with one batched statement per kind.
+
+    Adds run first, then updates (one statement per distinct set of changes), then deletes.
+    The response has one result per operation, in request order.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        if not token:
+            return jsonify({'error': 'Token required'}), 401
+        
+        payload = decode_token(token, JWT_SECRET)
+        user_id = payload['user_id']
+        
+        data = request_body()
+        operations = data['operations']
+        if not operations:
+            return jsonify({'error': 'Operations required'}), 400
+        
+        results = [None] * len(operations)
+        adds, updates, deletes = [], {}, []
+        
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict):
+                results[index] = {'index': index, 'status': 'error', 'error': 'Invalid operation'}
+                continue
+            op = operation.get('op')
+            try:
+                if op == 'add':
+                    SHOPPING_ITEM.validate(operation)
+                elif op == 'update':
+                    SHOPPING_ITEM_UPDATE.validate(operation)
+            except ValidationError as invalid:
+                results[index] = {'index': index, 'op': op, 'status': 'error', 'error': str(invalid)}
+                continue
+            if op == 'add':
+                if not operation.get('item_name'):
+                    results[index] = {'index': index, 'op': op, 'status': 'error', 'error': 'Item name required'}
+                    continue
+                adds.append((index, operation))
+            elif op in ('update', 'delete'):
+                if not operation.get('id'):
+                    results[index] = {'index': index, 'op': op, 'status': 'error', 'error': 'Item id required'}
+                    continue
+                # A malformed id would fail the whole batched statement, not just this operation
+                if not UUID_PATTERN.match(str(operation['id'])):
+                    results[index] = {'index': index, 'op': op, 'status': 'error', 'error': 'Invalid item id'}
+                    continue
+                if op == 'delete':
+                    deletes.append((index, str(operation['id'])))
+                    continue
+                changes = {field: operation[field] for field in SHOPPING_ITEM_UPDATE_FIELDS if field in operation}
+                if not changes:
+                    results[index] = {'index': index, 'op': op, 'status': 'error', 'error': 'Nothing to update'}
+                    continue
+                # Operations with identical changes share one UPDATE ... WHERE id IN (...)
+                key = tuple(sorted(changes.items()))
+                updates.setdefault(key, []).append((index, str(operation['id'])))
             else:
-                recent_data = {
-                    'user_id': user_id,
-                    'item_name': item_name,
-                    'category': category
-                }
-                supabase.table('recent_items').insert(recent_data).execute()
-            
-            return jsonify({'message': 'Item added successfully', 'item': result.data[0]}), 201
-            
+                results[index] = {'index': index, 'op': op, 'status': 'error', 'error': 'Unknown operation'}
+        
+        if adds:
+            try:
+                added = add_shopping_items(user_id, [operation for _, operation in adds])
+                for (index, _), item in zip(adds, added):
+                    results[index] = {'index': index, 'op': 'add', 'status': 'ok', 'item': item}
+            except Exception as add_error:
+                logging.error(f'Bulk shopping add failed: {add_error}')
+                for index, _ in adds:
+                    results[index] = {'index': index, 'op': 'add', 'status': 'error', 'error': 'Add failed'}
+        
+        now = datetime.now(timezone.utc).isoformat()
+        for key, targets in updates.items():
+            try:
+                result = supabase.table('shopping_items').update(dict(key, updated_at=now)).eq('user_id', user_id).in_('id', [item_id for _, item_id in targets]).execute()
+                updated = {str(item['id']): item for item in result.data}
+                for index, item_id in targets:
+                    if item_id in updated:
+                        results[index] = {'index': index, 'op': 'update', 'status': 'ok', 'item': updated[item_id]}
+                    else:
+                        results[index] = {'index': index, 'op': 'update', 'status': 'not_found'}
+            except Exception as update_error:
+                logging.error(f'Bulk shopping update failed: {update_error}')
+                for index, _ in targets:
+                    results[index] = {'index': index, 'op': 'update', 'status': 'error', 'error': 'Update failed'}
+        
+        if deletes:
+            try:
+                result = supabase.table('shopping_items').delete().eq('user_id', user_id).in_('id', [item_id for _, item_id in deletes]).execute()
+                deleted = {str(item['id']) for item in result.data}
+                for index, item_id in deletes:
+                    results[index] = {'index': index, 'op': 'delete', 'status': 'ok' if item_id in deleted else 'not_found'}
+            except Exception as delete_error:
+                logging.error(f'Bulk shopping delete failed: {delete_error}')
+                for index, _ in deletes:
+                    results[index] = {'index': index, 'op': 'delete', 'status': 'error', 'error': 'Delete failed'}
+        
+        return jsonify({'results': results}), 200
+        
     except jwt.ExpiredSignatureError:
         return jsonify({'error': 'Token expired'}), 401
     except jwt.InvalidTokenError:
@@ -925,6 +1686,101 @@ def shopping_items():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def load_planned_recipes(recipe_ids):
+    """Servings and ingredients of planned recipes keyed by meal plan recipe_id (admin_<id>, <id> or UUID)"""
+    admin_ids = {}
+    user_ids = []
+    for recipe_id in set(recipe_ids):
+        admin_id = recipe_id[len('admin_'):] if recipe_id.startswith('admin_') else recipe_id
+        if admin_id.isdigit():
+            admin_ids.setdefault(admin_id, []).append(recipe_id)
+        elif UUID_PATTERN.match(recipe_id):
+            user_ids.append(recipe_id)
+    
+    recipes = {}
+    if admin_ids:
+        for recipe in select_planned_recipes('admin_recipes', list(admin_ids)):
+            for recipe_id in admin_ids.get(str(recipe['id']), []):
+                recipes[recipe_id] = recipe
+    if user_ids:
+        for recipe in select_planned_recipes('recipes', user_ids):
+            recipes[str(recipe['id'])] = recipe
+    return recipes
+
+def select_planned_recipes(table, ids):
+    try:
+        return supabase.table(table).select('id, servings, ingredients, parsed_ingredients').in_('id', ids).execute().data
+    except Exception as db_error:
+        logging.warning(f'parsed_ingredients unavailable on {table}, reading raw ingredients: {db_error}')
+        return supabase.table(table).select('id, servings, ingredients').in_('id', ids).execute().data
+
+@app.route('/api/shopping/generate', methods=['POST', 'OPTIONS'])
+@validate_body(SHOPPING_GENERATE, authenticate=user_token_error)
+def generate_shopping_list():
+    """Build the shopping list for a planned week and add it in one insert.
+
+    Each recipe is scaled to meal servings x household size (people in user_persons,
+    at least 1) over the recipe's own servings; same ingredients are summed after
+    converting to grams, millilitres or a count unit.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        if not token:
+            return jsonify({'error': 'Token required'}), 401
+        
+        payload = decode_token(token, JWT_SECRET)
+        user_id = payload['user_id']
+        
+        data = request_body()
+        week = data.get('week', 'Week - 1')
+        
+        meals = supabase.table('meal_plans').select('recipe_id, servings').eq('user_id', user_id).eq('week', week).execute().data
+        if not meals:
+            return jsonify({'message': 'No meals planned for this week', 'items': [], 'skipped': []}), 200
+        
+        try:
+            household_size = max(1, len(supabase.table('user_persons').select('id').eq('user_id', user_id).execute().data))
+        except Exception as db_error:
+            logging.warning(f'user_persons table not found: {db_error}')
+            household_size = 1
+        
+        recipes = load_planned_recipes(str(meal['recipe_id']) for meal in meals)
+        
+        entries = []
+        skipped = []
+        for meal in meals:
+            recipe = recipes.get(str(meal['recipe_id']))
+            if not recipe:
+                skipped.append(meal['recipe_id'])
+                continue
+            scale = (meal.get('servings') or 1) * household_size / (recipe.get('servings') or 1)
+            entries.extend((ingredient, scale) for ingredient in recipe_ingredients(recipe))
+        
+        items = aggregate_ingredients(entries)
+        if not items:
+            return jsonify({'message': 'No ingredients found for this week', 'items': [], 'skipped': skipped}), 200
+        
+        result = supabase.table('shopping_items').insert([
+            dict(item, user_id=user_id, category='Other') for item in items
+        ]).execute()
+        
+        return jsonify({
+            'message': f'Added {len(result.data)} items from {week}',
+            'items': result.data,
+            'skipped': list(dict.fromkeys(skipped))
+        }), 201
+        
+    except jwt.ExpiredSignatureError:
+        return jsonify({'error': 'Token expired'}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({'error': 'Invalid token'}), 401
+    except Exception as e:
+        logging.error(f'Generate shopping list error: {e}')
+        return jsonify({'error': 'Failed to generate shopping list'}), 500
+
 @app.route('/api/shopping/recent', methods=['GET', 'OPTIONS'])
 def recent_items():
     if request.method == 'OPTIONS':
@@ -935,7 +1791,7 @@ def recent_items():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         result = supabase.table('recent_items').select('*').eq('user_id', user_id).order('frequency', desc=True).order('last_used', desc=True).limit(10).execute()
@@ -950,6 +1806,7 @@ def recent_items():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/shopping/items/<item_id>', methods=['PUT', 'DELETE', 'OPTIONS'])
+@validate_body({'PUT': SHOPPING_ITEM_UPDATE}, authenticate=user_token_error)
 def update_shopping_item(item_id):
     if request.method == 'OPTIONS':
         return '', 200
@@ -959,17 +1816,18 @@ def update_shopping_item(item_id):
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         if request.method == 'PUT':
-            data = request.get_json()
+            data = request_body()
             update_data = {}
             
             if 'is_completed' in data:
                 update_data['is_completed'] = data['is_completed']
             if 'quantity' in data:
                 update_data['quantity'] = data['quantity']
+            update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
             
             result = supabase.table('shopping_items').update(update_data).eq('id', item_id).eq('user_id', user_id).execute()
             
@@ -996,11 +1854,13 @@ def delete_account():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         # Delete user account (CASCADE will delete related data)
         supabase.table('users').delete().eq('id', user_id).execute()
+        author_cache.delete(str(user_id))
+        invalidate_profile(user_id)
         
         return jsonify({'message': 'Account deleted successfully'}), 200
         
@@ -1013,6 +1873,7 @@ def delete_account():
         return jsonify({'error': 'Failed to delete account'}), 500
 
 @app.route('/api/auth/change-password', methods=['PUT', 'OPTIONS'])
+@validate_body(PASSWORD_CHANGE, authenticate=user_token_error)
 def change_password():
     if request.method == 'OPTIONS':
         return '', 200
@@ -1022,10 +1883,10 @@ def change_password():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
-        data = request.get_json()
+        data = request_body()
         current_password = data.get('current_password')
         new_password = data.get('new_password')
         
@@ -1040,15 +1901,16 @@ def change_password():
         user = user_result.data[0]
         
         # Verify current password
-        if not check_password_hash(user['password_hash'], current_password):
+        if not verify_password(user['password_hash'], current_password):
             return jsonify({'error': 'Current password is incorrect'}), 401
         
         # Update password
-        new_password_hash = generate_password_hash(new_password)
+        new_password_hash = hash_password(new_password)
         supabase.table('users').update({
             'password_hash': new_password_hash,
             'updated_at': datetime.now(timezone.utc).isoformat()
         }).eq('id', user_id).execute()
+        invalidate_profile(user_id)
         
         return jsonify({'message': 'Password changed successfully'}), 200
         
@@ -1064,6 +1926,7 @@ def change_password():
 
 # Person Management Endpoints
 @app.route('/api/persons', methods=['GET', 'POST', 'OPTIONS'])
+@validate_body({'POST': PERSON}, authenticate=user_token_error)
 def manage_persons():
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -1077,20 +1940,24 @@ def manage_persons():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         if request.method == 'GET':
-            try:
-                result = supabase.table('user_persons').select('*').eq('user_id', user_id).order('created_at').execute()
-                return jsonify({'persons': result.data or []}), 200
-            except Exception as db_error:
-                logging.warning(f'user_persons table not found: {db_error}')
-                return jsonify({'persons': []}), 200
+            def build():
+                try:
+                    result = supabase.table('user_persons').select('*').eq('user_id', user_id).order('created_at').execute()
+                    return jsonify({'persons': result.data or []}), 200
+                except Exception as db_error:
+                    logging.warning(f'user_persons table not found: {db_error}')
+                    return fallback_response({'persons': []})
+            
+            etag = user_rows_etag(supabase.table('user_persons').select('id, updated_at').eq('user_id', user_id))
+            return conditional_response(etag, build)
             
         elif request.method == 'POST':
             try:
-                data = request.get_json()
+                data = request_body()
                 person_data = {
                     'user_id': user_id,
                     'name': data.get('name'),
@@ -1111,6 +1978,7 @@ def manage_persons():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/persons/<person_id>', methods=['PUT', 'DELETE', 'OPTIONS'])
+@validate_body({'PUT': PERSON}, authenticate=user_token_error)
 def person_detail(person_id):
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -1124,11 +1992,11 @@ def person_detail(person_id):
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         if request.method == 'PUT':
-            data = request.get_json()
+            data = request_body()
             update_data = {
                 'name': data.get('name'),
                 'preferences': data.get('preferences'),
@@ -1152,6 +2020,7 @@ def person_detail(person_id):
 
 # User Preferences Endpoints
 @app.route('/api/preferences', methods=['GET', 'PUT', 'OPTIONS'])
+@validate_body({'PUT': PREFERENCES}, authenticate=user_token_error)
 def user_preferences():
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -1165,23 +2034,27 @@ def user_preferences():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         if request.method == 'GET':
-            try:
-                result = supabase.table('user_preferences').select('*').eq('user_id', user_id).execute()
-                if result.data:
-                    return jsonify({'preferences': result.data[0]}), 200
-                else:
-                    return jsonify({'preferences': {'selected_week': 'Week - 1', 'view_mode': 'list'}}), 200
-            except Exception as db_error:
-                logging.warning(f'user_preferences table not found: {db_error}')
-                return jsonify({'preferences': {'selected_week': 'Week - 1', 'view_mode': 'list'}}), 200
+            def build():
+                try:
+                    result = supabase.table('user_preferences').select('*').eq('user_id', user_id).execute()
+                    if result.data:
+                        return jsonify({'preferences': result.data[0]}), 200
+                    else:
+                        return jsonify({'preferences': {'selected_week': 'Week - 1', 'view_mode': 'list'}}), 200
+                except Exception as db_error:
+                    logging.warning(f'user_preferences table not found: {db_error}')
+                    return fallback_response({'preferences': {'selected_week': 'Week - 1', 'view_mode': 'list'}})
+            
+            etag = user_rows_etag(supabase.table('user_preferences').select('id, updated_at').eq('user_id', user_id))
+            return conditional_response(etag, build)
                 
         elif request.method == 'PUT':
             try:
-                data = request.get_json()
+                data = request_body()
                 pref_data = {
                     'user_id': user_id,
                     'selected_week': data.get('selected_week'),
@@ -1202,13 +2075,231 @@ def user_preferences():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+MEAL_SLOT_CONFLICT = 'user_id,week,day,meal_time'
+SLOT_NAME_PATTERN = re.compile(r'^[A-Za-z][A-Za-z _-]{0,19}$')
+
+def meal_slot_key(meal):
+    return (meal.get('week'), meal.get('day'), meal.get('meal_time'))
+
+def upsert_meal_slots(meals):
+    """Write meals into their (user_id, week, day, meal_time) slots, replacing what was there.
+
+    The last meal wins if several target the same slot.
+    """
+    # updated_at must move on every write, conditional GETs compare it
+    now = datetime.now(timezone.utc).isoformat()
+    meals = list({meal_slot_key(meal): dict(meal, updated_at=now) for meal in meals}.values())
+    if not meals:
+        return []
+    
+    try:
+        return supabase.table('meal_plans').upsert(meals, on_conflict=MEAL_SLOT_CONFLICT).execute().data
+    except Exception as db_error:
+        # Only a database without the slot index is written in steps; those steps can race
+        if not is_missing_conflict_target(db_error):
+            raise
+        logging.warning(f'Meal slot upsert unavailable, replacing slots in steps: {db_error}')
+    
+    for meal in meals:
+        supabase.table('meal_plans').delete().eq('user_id', meal['user_id']).eq('week', meal['week']).eq('day', meal['day']).eq('meal_time', meal['meal_time']).execute()
+    return supabase.table('meal_plans').insert(meals).execute().data
+
+def clear_meal_slots(user_id, slots):
+    """Delete the meals in (week, day, meal_time) slots with one statement per week"""
+    by_week = {}
+    for week, day, meal_time in slots:
+        by_week.setdefault(week, []).append(f'and(day.eq."{day}",meal_time.eq."{meal_time}")')
+    
+    cleared = []
+    for week, conditions in by_week.items():
+        result = supabase.table('meal_plans').delete().eq('user_id', user_id).eq('week', week).or_(','.join(conditions)).execute()
+        cleared.extend(result.data)
+    return cleared
+
+@app.route('/api/meal-plan/slots', methods=['PATCH', 'OPTIONS'])
+@validate_body(MEAL_SLOTS, authenticate=user_token_error)
+def meal_plan_slots():
+    """Set or clear many meal slots in one call.
+
+    Each slot is {day, meal_time, week?, recipe_id, recipe_name, servings, image, time};
+    a slot with "clear": true (or no recipe_name) is emptied instead.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        if not token:
+            return jsonify({'error': 'Token required'}), 401
+        
+        payload = decode_token(token, JWT_SECRET)
+        user_id = payload['user_id']
+        
+        data = request_body()
+        default_week = data.get('week', 'Week - 1')
+        slots = data['slots']
+        if not slots:
+            return jsonify({'error': 'Slots required'}), 400
+        
+        now = datetime.now(timezone.utc).isoformat()
+        edits = {}
+        for slot in slots:
+            if not isinstance(slot, dict):
+                return jsonify({'error': 'Invalid slot'}), 400
+            day = slot.get('day')
+            meal_time = slot.get('meal_time')
+            week = slot.get('week', default_week)
+            if not all(isinstance(v, str) and SLOT_NAME_PATTERN.match(v) for v in (day, meal_time)) or not isinstance(week, str) or not week:
+                return jsonify({'error': 'Each slot needs a valid week, day and meal_time'}), 400
+            
+            if slot.get('clear') or not slot.get('recipe_name'):
+                edits[(week, day, meal_time)] = None
+            else:
+                edits[(week, day, meal_time)] = {
+                    'user_id': user_id,
+                    'week': week,
+                    'day': day,
+                    'meal_time': meal_time,
+                    'recipe_id': str(slot.get('recipe_id', '')),
+                    'recipe_name': slot['recipe_name'],
+                    'servings': slot.get('servings', 1),
+                    'image': slot.get('image', '🍽️'),
+                    'time': slot.get('time', ''),
+                    'created_at': now
+                }
+        
+        meals = upsert_meal_slots(meal for meal in edits.values() if meal)
+        cleared = clear_meal_slots(user_id, [key for key, meal in edits.items() if meal is None])
+        
+        return jsonify({'message': 'Meal plan updated', 'meal_plan': meals, 'cleared': len(cleared)}), 200
+        
+    except jwt.ExpiredSignatureError:
+        return jsonify({'error': 'Token expired'}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({'error': 'Invalid token'}), 401
+    except Exception as e:
+        logging.error(f'Meal plan slots error: {e}')
+        return jsonify({'error': 'Meal plan operation failed'}), 500
+
+def copy_week_in_steps(user_id, source_week, target_weeks, replace):
+    """Fallback for databases without the copy_meal_plan_week function"""
+    source = supabase.table('meal_plans').select('recipe_id, recipe_name, day, meal_time, servings, image, time').eq('user_id', user_id).eq('week', source_week).order('created_at').execute().data
+    if not source:
+        # Copying an empty week with replace empties the targets, as the SQL function does
+        if replace:
+            supabase.table('meal_plans').delete().eq('user_id', user_id).in_('week', target_weeks).execute()
+        return []
+    
+    now = datetime.now(timezone.utc).isoformat()
+    meals = [dict(meal, user_id=user_id, week=week, created_at=now, updated_at=now) for week in target_weeks for meal in source]
+    
+    if not replace:
+        filled = supabase.table('meal_plans').select('week, day, meal_time').eq('user_id', user_id).in_('week', target_weeks).execute().data
+        filled = {meal_slot_key(meal) for meal in filled}
+        meals = [meal for meal in meals if meal_slot_key(meal) not in filled]
+        return supabase.table('meal_plans').insert(meals).execute().data if meals else []
+    
+    copied = upsert_meal_slots(meals)
+    supabase.table('meal_plans').delete().eq('user_id', user_id).in_('week', target_weeks).not_.in_('id', [meal['id'] for meal in copied]).execute()
+    return copied
+
+@app.route('/api/meal-plan/copy', methods=['POST', 'OPTIONS'])
+@validate_body(MEAL_PLAN_COPY, authenticate=user_token_error)
+def copy_meal_plan_week():
+    """Copy a week's meals into other weeks.
+
+    With replace (default) the target weeks become exact copies; otherwise only
+    their empty slots are filled.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        if not token:
+            return jsonify({'error': 'Token required'}), 401
+        
+        payload = decode_token(token, JWT_SECRET)
+        user_id = payload['user_id']
+        
+        data = request_body()
+        source_week = data.get('source_week')
+        target_weeks = data.get('target_weeks')
+        replace = bool(data.get('replace', True))
+        
+        if not source_week:
+            return jsonify({'error': 'Source week required'}), 400
+        if not isinstance(target_weeks, list) or not all(isinstance(week, str) and week for week in target_weeks):
+            return jsonify({'error': 'Target weeks must be a list of week names'}), 400
+        target_weeks = [week for week in dict.fromkeys(target_weeks) if week != source_week]
+        if not target_weeks:
+            return jsonify({'error': 'Target weeks required'}), 400
+        
+        # Delete + INSERT ... SELECT for every target week in one transaction
+        try:
+            copied = supabase.rpc('copy_meal_plan_week', {
+                'p_user_id': user_id,
+                'p_source_week': source_week,
+                'p_target_weeks': target_weeks,
+                'p_replace': replace
+            }).execute().data or []
+        except Exception as rpc_error:
+            if not is_missing_function(rpc_error):
+                raise
+            logging.warning(f'copy_meal_plan_week RPC unavailable, copying in steps: {rpc_error}')
+            copied = copy_week_in_steps(user_id, source_week, target_weeks, replace)
+        
+        return jsonify({
+            'message': f'Copied {source_week} to {len(target_weeks)} week(s)',
+            'copied_meals': len(copied),
+            'meal_plan': copied
+        }), 200
+        
+    except jwt.ExpiredSignatureError:
+        return jsonify({'error': 'Token expired'}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({'error': 'Invalid token'}), 401
+    except Exception as e:
+        logging.error(f'Copy meal plan week error: {e}')
+        return jsonify({'error': 'Failed to copy meal plan'}), 500
+
+# Bulk generation: rows per insert statement and how long a response is replayed for an Idempotency-Key
+BULK_INSERT_CHUNK_SIZE = int(os.getenv('BULK_INSERT_CHUNK_SIZE', 50))
+idempotency_cache = TTLCache(maxsize=10000, ttl=int(os.getenv('IDEMPOTENCY_TTL', 86400)))
+
+def insert_meals_in_chunks(meals):
+    """Insert meals BULK_INSERT_CHUNK_SIZE rows at a time, leaving slots that are already filled alone"""
+    inserted = []
+    for start in range(0, len(meals), BULK_INSERT_CHUNK_SIZE):
+        chunk = meals[start:start + BULK_INSERT_CHUNK_SIZE]
+        try:
+            result = supabase.table('meal_plans').upsert(chunk, on_conflict=MEAL_SLOT_CONFLICT, ignore_duplicates=True).execute()
+        except Exception as db_error:
+            # Anything else (a timeout, a 5xx after the upsert committed) must not be retried
+            # as a plain insert, which would duplicate the slots
+            if not is_missing_conflict_target(db_error):
+                raise
+            logging.warning(f'Meal slot unique index missing, inserting chunk: {db_error}')
+            result = supabase.table('meal_plans').insert(chunk).execute()
+        inserted.extend(result.data)
+    return inserted
+
 # Enhanced Meal Plan Endpoints
 @app.route('/api/meal-plan/bulk', methods=['POST', 'OPTIONS'])
+@validate_body(MEAL_PLAN_BULK, authenticate=user_token_error)
 def bulk_meal_plan():
+    """Fill a week's empty slots with a generated month plan.
+
+    A week has one slot per (day, meal_time), so the month's dates collapse onto their
+    weekdays: 21 meals at most, the first date of each weekday winning.
+    Repeating a request with the same Idempotency-Key header (or idempotency_key
+    field) replays the first response; without one, a retry still only fills
+    slots that are empty.
+    """
     if request.method == 'OPTIONS':
         response = jsonify({})
         response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Idempotency-Key')
         response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,OPTIONS')
         return response, 200
     
@@ -1217,14 +2308,27 @@ def bulk_meal_plan():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
-        data = request.get_json()
+        data = request_body()
         month = data.get('month')
         year = data.get('year')
         week = data.get('week', 'Week - 1')  # Default to Week - 1
         
+        if month is None or year is None:
+            return jsonify({'error': 'Valid month and year required'}), 400
+        
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+        if idempotency_key:
+            cache_key = f'{user_id}:meal-plan-bulk:{idempotency_key}'
+            fingerprint = (month, year, week)
+            cached = idempotency_cache.get(cache_key)
+            if cached is not None:
+                if cached['fingerprint'] != fingerprint:
+                    return jsonify({'error': 'Idempotency key already used for a different request'}), 422
+                return jsonify(cached['body']), cached['status']
+        
         # Generate sample meal plan for the month
         import calendar
         from datetime import date
@@ -1239,14 +2343,15 @@ def bulk_meal_plan():
         # Get number of days in month
         days_in_month = calendar.monthrange(year, month)[1]
         
-        meals_to_add = []
+        # Weekday names repeat across the month; the first meal per slot is kept
+        meals_to_add = {}
         for day in range(1, days_in_month + 1):
             date_obj = date(year, month, day)
             day_name = date_obj.strftime('%A')
             
             for meal_time in meal_times:
                 meal_name = sample_meals[meal_time][day % len(sample_meals[meal_time])]
-                meals_to_add.append({
+                meals_to_add.setdefault((week, day_name, meal_time), {
                     'user_id': user_id,
                     'recipe_id': f'planned-{day}-{meal_time.lower()}',
                     'recipe_name': meal_name,
@@ -1257,11 +2362,19 @@ def bulk_meal_plan():
                     'week': week
                 })
         
-        # Insert all meals
-        if meals_to_add:
-            supabase.table('meal_plans').insert(meals_to_add).execute()
+        filled = supabase.table('meal_plans').select('week, day, meal_time').eq('user_id', user_id).eq('week', week).execute().data
+        filled = {meal_slot_key(meal) for meal in filled}
+        inserted = insert_meals_in_chunks([meal for key, meal in meals_to_add.items() if key not in filled])
         
-        return jsonify({'message': f'Meal plan created for {calendar.month_name[month]} {year} - {week}'}), 201
+        body = {
+            'message': f'Meal plan created for {calendar.month_name[month]} {year} - {week}',
+            'generated': len(meals_to_add),
+            'inserted': len(inserted),
+            'skipped': len(meals_to_add) - len(inserted)
+        }
+        if idempotency_key:
+            idempotency_cache.set(cache_key, {'fingerprint': fingerprint, 'status': 201, 'body': body})
+        return jsonify(body), 201
         
     except jwt.ExpiredSignatureError:
         return jsonify({'error': 'Token expired'}), 401
@@ -1270,8 +2383,38 @@ def bulk_meal_plan():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def parse_week_range(args):
+    """Week names from ?weeks=Week - 1,Week - 2 or ?from_week=1&to_week=5"""
+    if 'weeks' in args:
+        weeks = list(dict.fromkeys(w.strip() for w in args.get('weeks', '').split(',') if w.strip()))
+    else:
+        try:
+            first = int(args.get('from_week'))
+            last = int(args.get('to_week', first))
+        except (TypeError, ValueError):
+            raise ValueError('from_week and to_week must be week numbers')
+        if first < 1 or last < first:
+            raise ValueError('Invalid week range')
+        if last - first >= MAX_RANGE_WEEKS:
+            raise ValueError(f'At most {MAX_RANGE_WEEKS} weeks per request')
+        weeks = [f'Week - {n}' for n in range(first, last + 1)]
+    if not weeks:
+        raise ValueError('Weeks required')
+    if len(weeks) > MAX_RANGE_WEEKS:
+        raise ValueError(f'At most {MAX_RANGE_WEEKS} weeks per request')
+    return weeks
+
+def group_meal_plan(weeks, meals):
+    """[{week, days: {day: {meal_time: meal}}}] in request order; meals must be oldest first so the newest wins"""
+    grouped = {week: {} for week in weeks}
+    for meal in meals:
+        if meal.get('week') in grouped:
+            grouped[meal['week']].setdefault(meal.get('day'), {})[meal.get('meal_time')] = meal
+    return [{'week': week, 'days': days} for week, days in grouped.items()]
+
 @app.route('/api/meal-plan', methods=['GET', 'POST', 'DELETE', 'OPTIONS'])
 @track_usage('meal_plan_action')
+@validate_body({'POST': MEAL}, authenticate=user_token_error)
 def meal_plan():
     if request.method == 'OPTIONS':
         return '', 200
@@ -1282,23 +2425,44 @@ def meal_plan():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         if request.method == 'GET':
+            if 'weeks' in request.args or 'from_week' in request.args:
+                try:
+                    weeks = parse_week_range(request.args)
+                except ValueError as range_error:
+                    return jsonify({'error': str(range_error)}), 400
+                def build_range():
+                    try:
+                        result = supabase.table('meal_plans').select('*').eq('user_id', user_id).in_('week', weeks).order('created_at').execute()
+                    except Exception as db_error:
+                        logging.error(f'meal_plans range query failed: {db_error}')
+                        return fallback_response({'weeks': group_meal_plan(weeks, [])})
+                    return jsonify({'weeks': group_meal_plan(weeks, result.data)}), 200
+                
+                etag = user_rows_etag(supabase.table('meal_plans').select('id, updated_at').eq('user_id', user_id).in_('week', weeks))
+                return conditional_response(etag, build_range)
+            
             week = request.args.get('week', 'Week - 1')
             logging.info(f'Getting meal plan for week: {week}, user: {user_id}')
-            try:
-                result = supabase.table('meal_plans').select('*').eq('user_id', user_id).eq('week', week).order('created_at', desc=True).execute()
-                logging.info(f'Meal plan query result: {len(result.data)} items found')
-                return jsonify({'meal_plan': result.data}), 200
-            except Exception as db_error:
-                logging.error(f'meal_plans table query failed: {db_error}')
-                # Return empty array if table doesn't exist or has issues
-                return jsonify({'meal_plan': []}), 200
+            
+            def build():
+                try:
+                    result = supabase.table('meal_plans').select('*').eq('user_id', user_id).eq('week', week).order('created_at', desc=True).execute()
+                    logging.info(f'Meal plan query result: {len(result.data)} items found')
+                    return jsonify({'meal_plan': result.data}), 200
+                except Exception as db_error:
+                    logging.error(f'meal_plans table query failed: {db_error}')
+                    # Return empty array if table doesn't exist or has issues
+                    return fallback_response({'meal_plan': []})
+            
+            etag = user_rows_etag(supabase.table('meal_plans').select('id, updated_at').eq('user_id', user_id).eq('week', week))
+            return conditional_response(etag, build)
         
         elif request.method == 'POST':
-            data = request.get_json() or {}
+            data = request_body()
             week = data.get('week', 'Week - 1')
             
             logging.info(f'Adding meal to plan for week: {week}, data: {data}')
@@ -1317,13 +2481,10 @@ def meal_plan():
             }
             
             try:
-                # First, remove any existing meal for the same day/meal_time/week combination
-                supabase.table('meal_plans').delete().eq('user_id', user_id).eq('day', meal_data['day']).eq('meal_time', meal_data['meal_time']).eq('week', week).execute()
-                
-                # Then insert the new meal
-                result = supabase.table('meal_plans').insert(meal_data).execute()
-                logging.info(f'Meal added successfully: {result.data}')
-                return jsonify({'message': 'Added to meal plan', 'meal_plan': result.data}), 201
+                # Replaces any existing meal for the same day/meal_time/week combination
+                meals = upsert_meal_slots([meal_data])
+                logging.info(f'Meal added successfully: {meals}')
+                return jsonify({'message': 'Added to meal plan', 'meal_plan': meals}), 201
             except Exception as db_error:
                 logging.error(f'meal_plans table operation failed: {db_error}')
                 return jsonify({'message': 'Added to meal plan locally'}), 200
@@ -1348,6 +2509,7 @@ def meal_plan():
         return jsonify({'error': 'Meal plan operation failed'}), 500
 
 @app.route('/api/meal-plan/<meal_id>', methods=['PUT', 'DELETE', 'OPTIONS'])
+@validate_body({'PUT': MEAL}, authenticate=user_token_error)
 def meal_plan_detail(meal_id):
     if request.method == 'OPTIONS':
         return '', 200
@@ -1358,11 +2520,11 @@ def meal_plan_detail(meal_id):
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         if request.method == 'PUT':
-            data = request.get_json() or {}
+            data = request_body()
             
             update_data = {
                 'recipe_name': data.get('recipe_name'),
@@ -1409,7 +2571,7 @@ def get_analytics():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
         # Get user analytics
@@ -1436,26 +2598,49 @@ def get_analytics():
         return jsonify({'error': 'Failed to get analytics'}), 500
 
 # Admin functions
+# This app hard-coded the role permissions before the registry existed, so it keeps them as a fallback
+permission_registry = PermissionRegistry(
+    supabase,
+    refresh_interval=int(os.getenv('PERMISSION_REFRESH_INTERVAL', 300)),
+    defaults=DEFAULT_ROLE_PERMISSIONS
+)
+
 def get_admin_permissions(role):
-    # Simple role-based permissions without complex database queries
-    permissions = {
-        'super_admin': ['admin_management', 'user_management', 'recipe_management', 'analytics_view', 'system_settings'],
-        'sub_admin': ['user_management', 'recipe_management', 'analytics_view'],
-        'marketing_admin': ['analytics_view', 'marketing_campaigns']
-    }
-    return permissions.get(role, [])
+    return permission_registry.get(role)
+
+# Active admin identities for the verify endpoint, which the dashboard polls constantly
+ADMIN_IDENTITY_COLUMNS = 'id, email, name, role'
+admin_identity_cache = TTLCache(maxsize=1000, ttl=int(os.getenv('ADMIN_IDENTITY_CACHE_TTL', 60)))
+
+def get_admin_identity(admin_id):
+    admin = admin_identity_cache.get(str(admin_id))
+    if admin is None:
+        result = supabase.table('admin_users').select(ADMIN_IDENTITY_COLUMNS).eq('id', admin_id).eq('is_active', True).execute()
+        if not result.data:
+            return None
+        admin = result.data[0]
+        admin_identity_cache.set(str(admin_id), admin)
+    return admin
 
 def verify_admin_token(token):
     try:
-        payload = jwt.decode(token, ADMIN_JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, ADMIN_JWT_SECRET)
         return payload
     except:
         return None
 
+def admin_token_error():
+    """The 401 an admin route returns for a missing or bad token, or None; runs ahead of @validate_body"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    if not verify_admin_token(token):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
 
 
 # Admin endpoints
 @app.route('/api/admin/auth/login', methods=['POST', 'OPTIONS'])
+@validate_body(CREDENTIALS)
 def admin_login():
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -1465,7 +2650,7 @@ def admin_login():
         return response, 200
     
     try:
-        data = request.get_json()
+        data = request_body()
         email = data.get('email')
         password = data.get('password')
         
@@ -1479,9 +2664,11 @@ def admin_login():
         
         admin = admin_result.data[0]
         
-        if not check_password_hash(admin['password_hash'], password):
+        if not verify_password(admin['password_hash'], password):
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        upgrade_password_hash('admin_users', admin['id'], admin['password_hash'], password)
+        
         permissions = get_admin_permissions(admin['role'])
         
         token = jwt.encode({
@@ -1527,9 +2714,8 @@ def verify_admin_token_endpoint():
         if not payload:
             return jsonify({'error': 'Invalid token'}), 401
         
-        admin_result = supabase.table('admin_users').select('*').eq('id', payload['admin_id']).eq('is_active', True).execute()
-        if admin_result.data:
-            admin = admin_result.data[0]
+        admin = get_admin_identity(payload['admin_id'])
+        if admin:
             permissions = get_admin_permissions(admin['role'])
             return jsonify({
                 'admin': {
@@ -1555,6 +2741,7 @@ def admin_logout():
     return jsonify({'message': 'Logged out successfully'}), 200
 
 @app.route('/api/admin/users', methods=['GET', 'POST', 'OPTIONS'])
+@validate_body({'POST': ADMIN_USER}, authenticate=admin_token_error)
 def admin_users():
     if request.method == 'OPTIONS':
         return '', 200
@@ -1577,7 +2764,7 @@ def admin_users():
             if 'admin_management' not in payload.get('permissions', []):
                 return jsonify({'error': 'Insufficient permissions'}), 403
             
-            data = request.get_json()
+            data = request_body()
             email = data.get('email')
             password = data.get('password')
             name = data.get('name')
@@ -1595,7 +2782,7 @@ def admin_users():
             
             admin_data = {
                 'email': email,
-                'password_hash': generate_password_hash(password),
+                'password_hash': hash_password(password),
                 'name': name,
                 'role': role,
                 'created_by': payload['admin_id']
@@ -1620,6 +2807,7 @@ def admin_users():
         return jsonify({'error': 'Operation failed'}), 500
 
 @app.route('/api/admin/users/<admin_id>', methods=['PUT', 'DELETE', 'OPTIONS'])
+@validate_body({'PUT': ADMIN_USER}, authenticate=admin_token_error)
 def admin_user_detail(admin_id):
     if request.method == 'OPTIONS':
         return '', 200
@@ -1635,7 +2823,7 @@ def admin_user_detail(admin_id):
             return jsonify({'error': 'Insufficient permissions'}), 403
         
         if request.method == 'PUT':
-            data = request.get_json()
+            data = request_body()
             
             update_data = {
                 'name': data.get('name'),
@@ -1652,6 +2840,7 @@ def admin_user_detail(admin_id):
                 return jsonify({'error': 'Invalid role'}), 400
             
             result = supabase.table('admin_users').update(update_data).eq('id', admin_id).execute()
+            admin_identity_cache.delete(str(admin_id))
             
             if result.data:
                 admin = result.data[0]
@@ -1673,6 +2862,7 @@ def admin_user_detail(admin_id):
                 return jsonify({'error': 'Cannot delete your own account'}), 400
             
             result = supabase.table('admin_users').delete().eq('id', admin_id).execute()
+            admin_identity_cache.delete(str(admin_id))
             return jsonify({'message': 'Admin deleted successfully'}), 200
         
     except Exception as e:
@@ -1705,17 +2895,19 @@ def get_regular_users():
 
 # Admin recipe endpoints
 @app.route('/api/admin/recipes', methods=['GET', 'POST', 'OPTIONS'])
+@validate_body({'POST': ADMIN_RECIPE})
 def admin_recipes():
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
         if request.method == 'GET':
-            result = supabase.table('admin_recipes').select('*').order('created_at', desc=True).execute()
+            columns = '*' if wants_full_view() else ADMIN_RECIPE_SUMMARY_COLUMNS
+            result = supabase.table('admin_recipes').select(columns).order('created_at', desc=True).execute()
             return jsonify({'recipes': result.data}), 200
             
         elif request.method == 'POST':
-            data = request.get_json()
+            data = request_body()
             
             if not data.get('title'):
                 return jsonify({'error': 'Recipe title is required'}), 400
@@ -1736,10 +2928,11 @@ def admin_recipes():
                 'is_admin_recipe': True
             }
             
-            result = supabase.table('admin_recipes').insert(recipe_data).execute()
+            result = execute_recipe_write(lambda row: supabase.table('admin_recipes').insert(row), recipe_data)
             logging.info(f'Insert result: {result}')
             
             if result.data:
+                notify_recipe_change('admin_recipe', 'create', result.data[0]['id'], result.data[0].get('title'))
                 return jsonify({
                     'message': 'Recipe created successfully',
                     'recipe': result.data[0]
@@ -1752,13 +2945,14 @@ def admin_recipes():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/admin/recipes/<recipe_id>', methods=['PUT', 'DELETE', 'OPTIONS'])
+@validate_body({'PUT': ADMIN_RECIPE})
 def admin_recipe_detail(recipe_id):
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
         if request.method == 'PUT':
-            data = request.get_json()
+            data = request_body()
             
             update_data = {
                 'title': data.get('title'),
@@ -1777,16 +2971,19 @@ def admin_recipe_detail(recipe_id):
             
             update_data = {k: v for k, v in update_data.items() if v is not None}
             
-            result = supabase.table('admin_recipes').update(update_data).eq('id', recipe_id).execute()
+            result = execute_recipe_write(lambda row: supabase.table('admin_recipes').update(row).eq('id', recipe_id), update_data)
             
             if result.data:
+                notify_recipe_change('admin_recipe', 'update', result.data[0]['id'], result.data[0].get('title'))
                 return jsonify({
                     'message': 'Recipe updated successfully',
                     'recipe': result.data[0]
                 }), 200
         
         elif request.method == 'DELETE':
-            supabase.table('admin_recipes').delete().eq('id', recipe_id).execute()
+            result = supabase.table('admin_recipes').delete().eq('id', recipe_id).execute()
+            if result.data:
+                notify_recipe_change('admin_recipe', 'delete', result.data[0]['id'], result.data[0].get('title'))
             return jsonify({'message': 'Recipe deleted successfully'}), 200
         
     except Exception as e:
@@ -1795,6 +2992,7 @@ def admin_recipe_detail(recipe_id):
 
 # Admin meal plan endpoints
 @app.route('/api/admin/meal-plans', methods=['GET', 'POST', 'OPTIONS'])
+@validate_body({'POST': ADMIN_MEAL_PLAN})
 def admin_meal_plans():
     if request.method == 'OPTIONS':
         return '', 200
@@ -1805,7 +3003,7 @@ def admin_meal_plans():
             return jsonify({'meal_plans': result.data}), 200
             
         elif request.method == 'POST':
-            data = request.get_json()
+            data = request_body()
             
             meal_plan_data = {
                 'name': data.get('name'),
@@ -1842,6 +3040,7 @@ def admin_meal_plans():
                 if meal_entries:
                     supabase.table('meal_plans').insert(meal_entries).execute()
                 
+                admin_template_cache.invalidate()
                 return jsonify({
                     'message': 'Meal plan template created successfully',
                     'meal_plan': result.data[0]
@@ -1852,13 +3051,14 @@ def admin_meal_plans():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/admin/meal-plans/<plan_id>', methods=['PUT', 'DELETE', 'OPTIONS'])
+@validate_body({'PUT': ADMIN_MEAL_PLAN})
 def admin_meal_plan_detail(plan_id):
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
         if request.method == 'PUT':
-            data = request.get_json()
+            data = request_body()
             
             update_data = {
                 'name': data.get('name'),
@@ -1899,6 +3099,7 @@ def admin_meal_plan_detail(plan_id):
                 if meal_entries:
                     supabase.table('meal_plans').insert(meal_entries).execute()
                 
+                admin_template_cache.invalidate()
                 return jsonify({
                     'message': 'Meal plan template updated successfully',
                     'meal_plan': result.data[0]
@@ -1912,6 +3113,7 @@ def admin_meal_plan_detail(plan_id):
             template_id = f"template_admin_{plan_id}"
             supabase.table('meal_plans').delete().eq('week', template_id).execute()
             
+            admin_template_cache.invalidate()
             return jsonify({'message': 'Meal plan template deleted successfully'}), 200
         
     except Exception as e:
@@ -1954,6 +3156,64 @@ def get_meal_plan_sync():
         logging.error(f'Get meal plan sync error: {e}')
         return jsonify({'error': 'Failed to get sync data'}), 500
 
+def get_admin_meal_plans_version():
+    """(row count, latest updated_at) of admin_meal_plans; changes on every insert, update or delete"""
+    result = supabase.table('admin_meal_plans').select('updated_at', count='exact').order('updated_at', desc=True).limit(1).execute()
+    return (result.count, result.data[0]['updated_at'] if result.data else None)
+
+def group_template_meals(meals):
+    """Keep only named meals from an admin plan's {day: {meal_time: meal}} structure"""
+    grouped = {}
+    for day, day_meals in (meals or {}).items():
+        if not isinstance(day_meals, dict):
+            continue
+        for meal_time, meal_data in day_meals.items():
+            if isinstance(meal_data, dict) and meal_data.get('recipe_name'):
+                grouped.setdefault(day, {})[meal_time] = {
+                    'recipe_name': meal_data.get('recipe_name'),
+                    'servings': meal_data.get('servings', 1),
+                    'image': meal_data.get('image', '🍽️')
+                }
+    return grouped
+
+def build_template_snapshot():
+    """Format every active admin meal plan as a user-facing template, like /api/meal-plans/admin"""
+    result = supabase.table('admin_meal_plans').select('id, name, description, week_start, meals, created_at') \
+        .eq('status', 'active').order('created_at', desc=True).execute()
+    
+    templates = []
+    for plan in result.data:
+        meals = group_template_meals(plan.get('meals'))
+        if not meals:
+            continue
+        
+        name = plan.get('name') or f"Admin {plan['id']} Plan"
+        templates.append({
+            'id': f"template_admin_{plan['id']}",
+            'name': name,
+            'description': plan.get('description') or f"Curated {name.lower()} with balanced nutrition",
+            'week_start': plan.get('week_start') or '2024-01-01',
+            'meals': meals,
+            'created_by': 'Admin',
+            'is_admin_template': True,
+            'created_at': plan.get('created_at') or '2024-01-01T00:00:00Z'
+        })
+    
+    logging.info(f'Built template snapshot with {len(templates)} templates')
+    body = json_bytes(app, {'templates': templates})
+    return {
+        'templates': templates,
+        'body': body,
+        'etag': hashlib.sha1(body).hexdigest()
+    }
+
+# Admin meal plan templates, rebuilt when admin_meal_plans changes
+admin_template_cache = VersionedCache(
+    get_admin_meal_plans_version,
+    check_interval=int(os.getenv('TEMPLATE_CACHE_CHECK_INTERVAL', 30)),
+    max_age=int(os.getenv('TEMPLATE_CACHE_MAX_AGE', 600))
+)
+
 @app.route('/api/meal-plans/admin-templates', methods=['GET', 'OPTIONS'])
 def get_admin_meal_plan_templates():
     """Get admin meal plan templates for users to apply"""
@@ -1965,69 +3225,10 @@ def get_admin_meal_plan_templates():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        logging.info(f'Verifying token for admin templates')
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        logging.info(f'Token verified for user: {payload.get("user_id")}')
-        
-        # Get template meals from meal_plans table
-        # Get all records and filter for templates in Python since Supabase NULL queries can be tricky
-        result = supabase.table('meal_plans').select('*').execute()
-        template_meals = [meal for meal in result.data if meal.get('user_id') is None and meal.get('week', '').startswith('template_')]
-        
-        # Group meals by template
-        templates_data = {}
-        logging.info(f'Found {len(template_meals)} template meals')
-        
-        for meal in template_meals:
-            try:
-                week = meal.get('week', '')
-                if week.startswith('template_'):
-                    template_id = week.replace('template_', '')
-                    if template_id not in templates_data:
-                        templates_data[template_id] = {
-                            'meals': {},
-                            'name': template_id.replace('_', ' ').title() + ' Plan'
-                        }
-                    
-                    day = meal.get('day')
-                    meal_time = meal.get('meal_time')
-                    
-                    if day and meal_time:  # Ensure both are not None
-                        if day not in templates_data[template_id]['meals']:
-                            templates_data[template_id]['meals'][day] = {}
-                        
-                        templates_data[template_id]['meals'][day][meal_time] = {
-                            'recipe_name': meal.get('recipe_name'),
-                            'servings': meal.get('servings', 1),
-                            'image': meal.get('image', '🍽️')
-                        }
-            except Exception as meal_error:
-                logging.error(f'Error processing meal: {meal_error}, meal: {meal}')
-                continue
-        
-        # Format templates
-        templates = []
-        logging.info(f'Templates data keys: {list(templates_data.keys())}')
+        decode_token(token, JWT_SECRET)
         
-        for template_id, data in templates_data.items():
-            try:
-                template = {
-                    'id': f"template_{template_id}",
-                    'name': data['name'],
-                    'description': f"Curated {data['name'].lower()} with balanced nutrition",
-                    'week_start': '2024-01-01',
-                    'meals': data['meals'],
-                    'created_by': 'Admin',
-                    'is_admin_template': True,
-                    'created_at': '2024-01-01T00:00:00Z'
-                }
-                templates.append(template)
-                logging.info(f'Added template: {template["name"]}')
-            except Exception as template_error:
-                logging.error(f'Error formatting template {template_id}: {template_error}')
-                continue
-            
-        return jsonify({'templates': templates}), 200
+        snapshot = admin_template_cache.get(build_template_snapshot)
+        return conditional_response(snapshot['etag'], lambda: app.response_class(snapshot['body'], status=200, mimetype='application/json'))
         
     except jwt.ExpiredSignatureError:
         return jsonify({'error': 'Token expired'}), 401
@@ -2039,7 +3240,56 @@ def get_admin_meal_plan_templates():
         logging.error(f'Traceback: {traceback.format_exc()}')
         return jsonify({'error': f'Failed to get templates: {str(e)}'}), 500
 
+def get_template_meals(template_id):
+    """Template meal rows from the snapshot, falling back to the template rows stored in meal_plans"""
+    snapshot = admin_template_cache.get(build_template_snapshot)
+    for template in snapshot['templates']:
+        if template['id'] == template_id:
+            plan_id = template_id[len('template_admin_'):]
+            return [
+                {
+                    'recipe_id': f"template_{plan_id}_{day}_{meal_time}",
+                    'recipe_name': meal['recipe_name'],
+                    'day': day,
+                    'meal_time': meal_time,
+                    'servings': meal['servings'],
+                    'image': meal['image']
+                }
+                for day, day_meals in template['meals'].items()
+                for meal_time, meal in day_meals.items()
+            ]
+    
+    result = supabase.table('meal_plans').select('recipe_id, recipe_name, day, meal_time, servings, image').is_('user_id', 'null').eq('week', template_id).execute()
+    return result.data
+
+def apply_template_in_steps(user_id, template_id, target_week):
+    """Fallback for databases without the apply_meal_plan_template function.
+
+    The template's slots are upserted before the rest of the week is removed, so a
+    failed write never leaves the user with an empty week.
+    """
+    template_meals = get_template_meals(template_id)
+    if not template_meals:
+        return []
+    
+    meal_entries = [{
+        'user_id': user_id,
+        'recipe_id': f"applied_{template_meal['recipe_id']}_{user_id}",
+        'recipe_name': template_meal.get('recipe_name'),
+        'day': template_meal.get('day'),
+        'meal_time': template_meal.get('meal_time'),
+        'servings': template_meal.get('servings', 1),
+        'image': template_meal.get('image', '🍽️'),
+        'week': target_week
+    } for template_meal in template_meals]
+    
+    inserted = upsert_meal_slots(meal_entries)
+    new_ids = [meal['id'] for meal in inserted]
+    supabase.table('meal_plans').delete().eq('user_id', user_id).eq('week', target_week).not_.in_('id', new_ids).execute()
+    return inserted
+
 @app.route('/api/meal-plans/apply-template', methods=['POST', 'OPTIONS'])
+@validate_body(APPLY_TEMPLATE, authenticate=user_token_error)
 def apply_meal_plan_template():
     """Apply an admin meal plan template to user's meal plan"""
     if request.method == 'OPTIONS':
@@ -2050,59 +3300,38 @@ def apply_meal_plan_template():
         if not token:
             return jsonify({'error': 'Token required'}), 401
         
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        payload = decode_token(token, JWT_SECRET)
         user_id = payload['user_id']
         
-        data = request.get_json()
+        data = request_body()
         template_id = data.get('template_id')
         target_week = data.get('week', 'Week - 1')
         
         if not template_id:
             return jsonify({'error': 'Template ID required'}), 400
             
-        # Extract template identifier
-        template_week = template_id  # e.g., 'template_admin_mediterranean'
-        
-        # Get template meals
-        # Get all records and filter for the specific template
-        all_meals = supabase.table('meal_plans').select('*').execute()
-        template_meals = [meal for meal in all_meals.data if meal.get('user_id') is None and meal.get('week') == template_week]
-        
-        # Create a mock result object
-        class MockResult:
-            def __init__(self, data):
-                self.data = data
-        
-        template_result = MockResult(template_meals)
-        
-        if not template_result.data:
+        # Delete + INSERT ... SELECT in one transaction, filtered on the template at the database
+        try:
+            result = supabase.rpc('apply_meal_plan_template', {
+                'p_user_id': user_id,
+                'p_template_id': template_id,
+                'p_target_week': target_week
+            }).execute()
+            applied_meals = result.data or []
+        except Exception as rpc_error:
+            if not is_missing_function(rpc_error):
+                raise
+            logging.warning(f'apply_meal_plan_template RPC unavailable, applying in steps: {rpc_error}')
+            applied_meals = apply_template_in_steps(user_id, template_id, target_week)
+        
+        if not applied_meals:
             return jsonify({'error': 'Template not found'}), 404
-            
-        # Clear existing meals for the target week
-        supabase.table('meal_plans').delete().eq('user_id', user_id).eq('week', target_week).execute()
         
-        # Apply template meals
-        meal_entries = []
-        for template_meal in template_result.data:
-            meal_entry = {
-                'user_id': user_id,
-                'recipe_id': f"applied_{template_meal['recipe_id']}_{user_id}",
-                'recipe_name': template_meal.get('recipe_name'),
-                'day': template_meal.get('day'),
-                'meal_time': template_meal.get('meal_time'),
-                'servings': template_meal.get('servings', 1),
-                'image': template_meal.get('image', '🍽️'),
-                'week': target_week
-            }
-            meal_entries.append(meal_entry)
-        
-        if meal_entries:
-            supabase.table('meal_plans').insert(meal_entries).execute()
-            
         template_name = template_id.replace('template_', '').replace('_', ' ').title()
         return jsonify({
             'message': f'Template "{template_name}" applied to {target_week}',
-            'applied_meals': len(meal_entries)
+            'applied_meals': len(applied_meals),
+            'meal_plan': applied_meals
         }), 200
         
     except jwt.ExpiredSignatureError:
@@ -2115,6 +3344,7 @@ def apply_meal_plan_template():
 
 # Subscription Plans endpoints
 @app.route('/api/admin/subscription-plans', methods=['GET', 'POST', 'OPTIONS'])
+@validate_body({'POST': SUBSCRIPTION_PLAN})
 def admin_subscription_plans():
     if request.method == 'OPTIONS':
         return '', 200
@@ -2125,7 +3355,7 @@ def admin_subscription_plans():
             return jsonify({'plans': result.data}), 200
             
         elif request.method == 'POST':
-            data = request.get_json()
+            data = request_body()
             
             plan_data = {
                 'name': data.get('name'),
@@ -2149,6 +3379,7 @@ def admin_subscription_plans():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/admin/subscription-plans/<plan_id>', methods=['PUT', 'DELETE', 'OPTIONS'])
+@validate_body({'PUT': SUBSCRIPTION_PLAN})
 def admin_subscription_plan_detail(plan_id):
     if request.method == 'OPTIONS':
         response = jsonify({})
@@ -2159,7 +3390,7 @@ def admin_subscription_plan_detail(plan_id):
     
     try:
         if request.method == 'PUT':
-            data = request.get_json() or {}
+            data = request_body()
             
             update_data = {
                 'name': data.get('name'),
@@ -67,7 +67,7 @@ def login():
 def verify_token():
     try:
         user_id = request.user['user_id']
-        user = User.find_by_id(user_id)
+        user = User.find_profile_by_id(user_id)
         
         if user:
             return jsonify({
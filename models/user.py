@@ -1,13 +1,14 @@
 from datetime import datetime, timezone
 from config.database import get_supabase_client
-from werkzeug.security import generate_password_hash, check_password_hash
+from utils.passwords import hash_password, verify_password
+from utils.profiles import get_profile
 
 supabase = get_supabase_client()
 
 class User:
     @staticmethod
     def create(email, password, name=None):
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
         user_data = {
             'email': email,
             'password_hash': hashed_password,
@@ -27,9 +28,14 @@ class User:
         result = supabase.table('users').select('*').eq('id', user_id).execute()
         return result.data[0] if result.data else None
     
+    @staticmethod
+    def find_profile_by_id(user_id):
+        """Public profile fields (no password_hash), cached per process"""
+        return get_profile(supabase, user_id)
+    
     @staticmethod
     def verify_password(user, password):
-        return check_password_hash(user['password_hash'], password)
+        return verify_password(user['password_hash'], password)
     
     @staticmethod
     def update_last_login(user_id):
@@ -51,4 +51,7 @@ INSERT INTO admin_recipes (title, description, ingredients, instructions, cook_t
 ('Overnight Oats with Berries', 'Easy make-ahead breakfast with fresh berries', 
  '["1/2 cup rolled oats", "1/2 cup milk", "1 tbsp chia seeds", "1 tbsp honey", "1/4 cup mixed berries", "1 tbsp almond butter", "1/4 tsp vanilla extract"]',
  '["Mix oats, milk, chia seeds, and vanilla in a jar", "Add honey and stir well", "Top with berries and almond butter", "Refrigerate overnight", "Enjoy cold in the morning"]',
- 5, 1, 'easy', 'Breakfast', '🥣', 'Admin', 'published');
\ No newline at end of file
+ 5, 1, 'easy', 'Breakfast', '🥣', 'Admin', 'published');
+
+-- Parsed form of ingredients ([{text, quantity, unit, name}]), written alongside ingredients
+ALTER TABLE admin_recipes ADD COLUMN IF NOT EXISTS parsed_ingredients JSONB;
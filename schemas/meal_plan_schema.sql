@@ -26,4 +26,90 @@ CREATE INDEX IF NOT EXISTS idx_meal_plans_user_day_week ON meal_plans(user_id, d
 -- ON meal_plans(user_id, day, meal_time, week);
 
 -- Disable Row Level Security for custom authentication
-ALTER TABLE meal_plans DISABLE ROW LEVEL SECURITY;
\ No newline at end of file
+ALTER TABLE meal_plans DISABLE ROW LEVEL SECURITY;
+
+-- Template rows (user_id IS NULL) are looked up by week when applying a template
+CREATE INDEX IF NOT EXISTS idx_meal_plans_template_week ON meal_plans(week) WHERE user_id IS NULL;
+
+-- Meals of a template: admin plans ('template_admin_<id>') come from admin_meal_plans.meals,
+-- anything else from the template rows stored in meal_plans
+CREATE OR REPLACE FUNCTION template_meals(p_template_id TEXT)
+RETURNS TABLE (recipe_id TEXT, recipe_name TEXT, day TEXT, meal_time TEXT, servings INTEGER, image TEXT) AS $$
+    SELECT 'template_' || p.id || '_' || d.key || '_' || m.key,
+           m.value->>'recipe_name',
+           d.key,
+           m.key,
+           COALESCE((m.value->>'servings')::numeric::INTEGER, 1),
+           COALESCE(m.value->>'image', '🍽️')
+    FROM admin_meal_plans p
+    CROSS JOIN LATERAL jsonb_each(CASE WHEN jsonb_typeof(p.meals) = 'object' THEN p.meals ELSE '{}'::jsonb END) d
+    CROSS JOIN LATERAL jsonb_each(CASE WHEN jsonb_typeof(d.value) = 'object' THEN d.value ELSE '{}'::jsonb END) m
+    WHERE 'template_admin_' || p.id = p_template_id
+      AND jsonb_typeof(m.value) = 'object'
+      AND COALESCE(m.value->>'recipe_name', '') <> ''
+    UNION ALL
+    SELECT t.recipe_id, t.recipe_name, t.day, t.meal_time, COALESCE(t.servings, 1), COALESCE(t.image, '🍽️')
+    FROM meal_plans t
+    WHERE t.user_id IS NULL AND t.week = p_template_id
+      AND NOT EXISTS (SELECT 1 FROM admin_meal_plans p WHERE 'template_admin_' || p.id = p_template_id);
+$$ LANGUAGE sql STABLE;
+
+-- Replace a user's week with a template in one transaction and return the new rows.
+-- Unknown or empty templates return no rows and leave the week untouched.
+CREATE OR REPLACE FUNCTION apply_meal_plan_template(p_user_id UUID, p_template_id TEXT, p_target_week TEXT)
+RETURNS SETOF meal_plans AS $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM template_meals(p_template_id)) THEN
+        RETURN;
+    END IF;
+
+    DELETE FROM meal_plans WHERE user_id = p_user_id AND week = p_target_week;
+
+    RETURN QUERY
+    INSERT INTO meal_plans (user_id, recipe_id, recipe_name, day, meal_time, servings, image, week)
+    SELECT DISTINCT ON (t.day, t.meal_time)
+           p_user_id, 'applied_' || t.recipe_id || '_' || p_user_id, t.recipe_name, t.day, t.meal_time, t.servings, t.image, p_target_week
+    FROM template_meals(p_template_id) t
+    RETURNING *;
+END;
+$$ LANGUAGE plpgsql;
+
+-- One meal per user slot so meal writes can upsert on (user_id, week, day, meal_time).
+-- Template rows (user_id IS NULL) never conflict. Duplicates left while the unique
+-- index was dropped are removed first, keeping the newest (rows without created_at
+-- count as oldest).
+DELETE FROM meal_plans
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, row_number() OVER (
+                   PARTITION BY user_id, week, day, meal_time
+                   ORDER BY created_at DESC NULLS LAST, id DESC
+               ) AS position
+        FROM meal_plans
+        WHERE user_id IS NOT NULL AND week IS NOT NULL AND day IS NOT NULL AND meal_time IS NOT NULL
+    ) ranked
+    WHERE position > 1
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_meal_plans_user_week_slot ON meal_plans(user_id, week, day, meal_time);
+
+-- Copy a user's week into other weeks in one transaction. With p_replace the target
+-- weeks are cleared first; otherwise only their empty slots are filled.
+CREATE OR REPLACE FUNCTION copy_meal_plan_week(p_user_id UUID, p_source_week TEXT, p_target_weeks TEXT[], p_replace BOOLEAN DEFAULT TRUE)
+RETURNS SETOF meal_plans AS $$
+BEGIN
+    IF p_replace THEN
+        DELETE FROM meal_plans
+        WHERE user_id = p_user_id AND week = ANY(p_target_weeks) AND week <> p_source_week;
+    END IF;
+
+    RETURN QUERY
+    INSERT INTO meal_plans (user_id, recipe_id, recipe_name, day, meal_time, servings, image, time, week)
+    SELECT p_user_id, m.recipe_id, m.recipe_name, m.day, m.meal_time, m.servings, m.image, m.time, t.week
+    FROM meal_plans m
+    CROSS JOIN unnest(p_target_weeks) AS t(week)
+    WHERE m.user_id = p_user_id AND m.week = p_source_week AND t.week <> p_source_week
+    ON CONFLICT (user_id, week, day, meal_time) DO NOTHING
+    RETURNING *;
+END;
+$$ LANGUAGE plpgsql;
@@ -24,4 +24,7 @@ ALTER TABLE recipes ADD COLUMN IF NOT EXISTS image VARCHAR(255) DEFAULT '🍽️
 CREATE INDEX IF NOT EXISTS idx_recipes_user_id ON recipes(user_id);
 
 -- Disable Row Level Security for custom authentication
-ALTER TABLE recipes DISABLE ROW LEVEL SECURITY;
\ No newline at end of file
+ALTER TABLE recipes DISABLE ROW LEVEL SECURITY;
+
+-- Parsed form of ingredients ([{text, quantity, unit, name}]), written alongside ingredients
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS parsed_ingredients JSONB;
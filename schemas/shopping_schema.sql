@@ -30,4 +30,26 @@ CREATE TABLE recent_items (
 CREATE UNIQUE INDEX idx_recent_items_user_item ON recent_items(user_id, LOWER(item_name));
 
 -- Create index for faster recent items lookup
-CREATE INDEX idx_recent_items_user_frequency ON recent_items(user_id, frequency DESC, last_used DESC);
\ No newline at end of file
+CREATE INDEX idx_recent_items_user_frequency ON recent_items(user_id, frequency DESC, last_used DESC);
+
+-- Add shopping items and bump their recent_items frequency in one round trip.
+-- p_items is a JSON array of {item_name, category, quantity, unit}; duplicates are
+-- grouped first because ON CONFLICT cannot update the same row twice in one statement.
+CREATE OR REPLACE FUNCTION add_shopping_items(p_user_id UUID, p_items JSONB)
+RETURNS SETOF shopping_items AS $$
+BEGIN
+    INSERT INTO recent_items AS r (user_id, item_name, category, frequency, last_used)
+    SELECT p_user_id, MIN(i.item_name), MIN(COALESCE(i.category, 'Other')), COUNT(*), NOW()
+    FROM jsonb_to_recordset(p_items) AS i(item_name VARCHAR, category VARCHAR)
+    GROUP BY LOWER(i.item_name)
+    ON CONFLICT (user_id, LOWER(item_name)) DO UPDATE
+        SET frequency = r.frequency + EXCLUDED.frequency,
+            last_used = NOW();
+
+    RETURN QUERY
+    INSERT INTO shopping_items (user_id, item_name, category, quantity, unit)
+    SELECT p_user_id, i.item_name, COALESCE(i.category, 'Other'), COALESCE(i.quantity, 1), COALESCE(i.unit, 'pcs')
+    FROM jsonb_to_recordset(p_items) AS i(item_name VARCHAR, category VARCHAR, quantity INTEGER, unit VARCHAR)
+    RETURNING *;
+END;
+$$ LANGUAGE plpgsql;
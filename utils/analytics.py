@@ -0,0 +1,107 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+class AnalyticsWriter:
+    """Buffers analytics events in a bounded queue and inserts them in batches from a background thread.
+
+    Events are written when batch_size events are waiting or flush_interval seconds
+    have passed, whichever comes first. When the queue is full new events are
+    dropped (and counted) instead of blocking the request.
+    """
+
+    def __init__(self, supabase, table='user_analytics', max_queue=10000, batch_size=100, flush_interval=2.0):
+        self.supabase = supabase
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._counters = {'enqueued': 0, 'dropped': 0, 'written': 0, 'failed': 0}
+        self._counter_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _count(self, name, amount=1):
+        with self._counter_lock:
+            self._counters[name] += amount
+
+    def _ensure_started(self):
+        # Threads don't survive a fork (e.g. gunicorn --preload), so start per process
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='analytics-writer', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, event):
+        """Queue an event without blocking; returns False if it was dropped"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('enqueued')
+        return True
+
+    def _drain(self, batch, timeout):
+        deadline = time.monotonic() + timeout
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            self.supabase.table(self.table).insert(batch).execute()
+            self._count('written', len(batch))
+        except Exception as e:
+            self._count('failed', len(batch))
+            logging.warning(f'Analytics batch insert failed ({len(batch)} events): {e}')
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._write(self._drain([], self.flush_interval))
+
+    def flush(self):
+        """Write everything currently queued from the calling thread"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self, timeout=5.0):
+        """Stop the writer thread and flush remaining events"""
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._counter_lock:
+            stats = dict(self._counters)
+        stats['queued'] = self._queue.qsize()
+        return stats
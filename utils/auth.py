@@ -1,13 +1,50 @@
 import jwt
+import os
+import time
+import hashlib
 from datetime import datetime, timedelta, timezone
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, g, has_app_context
 from config.settings import JWT_SECRET, ADMIN_JWT_SECRET
+from utils.cache import TTLCache
+
+# Recently verified tokens: sha256 digest -> payload, kept no longer than the token's own expiry
+verified_tokens = TTLCache(
+    maxsize=int(os.getenv('TOKEN_CACHE_SIZE', 10000)),
+    ttl=int(os.getenv('TOKEN_CACHE_TTL', 300))
+)
+
+def _token_key(token, secret):
+    # The secret is part of the key so a user token never verifies as an admin token
+    return hashlib.sha256(f'{secret}\0{token}'.encode('utf-8')).hexdigest()
+
+def decode_token(token, secret=JWT_SECRET):
+    """Verify a JWT once per request and reuse recent verifications; raises jwt errors like jwt.decode"""
+    key = _token_key(token, secret)
+    
+    request_tokens = None
+    if has_app_context():
+        request_tokens = g.setdefault('verified_tokens', {})
+        if key in request_tokens:
+            return request_tokens[key]
+    
+    payload = verified_tokens.get(key)
+    if payload is None or ('exp' in payload and payload['exp'] <= time.time()):
+        payload = jwt.decode(token, secret, algorithms=['HS256'])
+        ttl = verified_tokens.ttl
+        if 'exp' in payload:
+            ttl = min(ttl, payload['exp'] - time.time())
+        if ttl > 0:
+            verified_tokens.set(key, payload, ttl=ttl)
+    
+    payload = dict(payload)
+    if request_tokens is not None:
+        request_tokens[key] = payload
+    return payload
 
 def verify_token(token, secret=JWT_SECRET):
     try:
-        payload = jwt.decode(token, secret, algorithms=['HS256'])
-        return payload
+        return decode_token(token, secret)
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
@@ -28,6 +65,7 @@ def require_auth(f):
         if not payload:
             return jsonify({'error': 'Invalid or expired token'}), 401
         
+        g.user = payload
         request.user = payload
         return f(*args, **kwargs)
     return decorated_function
@@ -43,6 +81,7 @@ def require_admin_auth(f):
         if not payload:
             return jsonify({'error': 'Invalid or expired admin token'}), 401
         
+        g.admin = payload
         request.admin = payload
         return f(*args, **kwargs)
     return decorated_function
\ No newline at end of file
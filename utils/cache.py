@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class TTLCache:
+    """Bounded, thread-safe in-memory cache with per-entry expiry (LRU eviction)"""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        """Return a dict of the cached (non-expired) entries among keys"""
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key, _MISSING)
+                if entry is _MISSING:
+                    continue
+                value, expires_at = entry
+                if expires_at <= now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def set_many(self, items, ttl=None):
+        for key, value in items.items():
+            self.set(key, value, ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class VersionedCache:
+    """Single cached value that is rebuilt when an external version token changes.
+
+    The version is re-checked at most once every check_interval seconds and the
+    value is rebuilt unconditionally once it is older than max_age seconds.
+    """
+
+    def __init__(self, version_fn, check_interval=15, max_age=300):
+        self.version_fn = version_fn
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._value = _MISSING
+        self._version = None
+        self._checked_at = 0.0
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._version
+
+    def _fresh(self, value, now):
+        return (value is not _MISSING
+                and now - self._checked_at < self.check_interval
+                and now - self._built_at < self.max_age)
+
+    def get(self, build_fn):
+        value = self._value
+        if self._fresh(value, time.monotonic()):
+            return value
+
+        # Only one thread checks the version / rebuilds; the others wait and reuse it
+        with self._lock:
+            now = time.monotonic()
+            if self._fresh(self._value, now):
+                return self._value
+
+            try:
+                version = self.version_fn()
+            except Exception as e:
+                logging.warning(f'Cache version check failed: {e}')
+                version = self._version
+
+            if (self._value is not _MISSING and version == self._version
+                    and now - self._built_at < self.max_age):
+                self._checked_at = now
+                return self._value
+
+            value = build_fn()
+            self._value = value
+            self._version = version
+            self._checked_at = self._built_at = now
+            return value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = _MISSING
@@ -0,0 +1,77 @@
+import gzip
+import hashlib
+import os
+from flask import request
+from utils.cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this go out uncompressed; framing overhead outweighs the savings
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript'}
+
+class ResponseCompressor:
+    """Compresses responses by Accept-Encoding (br if the brotli package is installed, else gzip).
+
+    Compressed bytes of responses that carry an ETag are cached, so a hot cached payload
+    like the discover feed is compressed once per version. The key also has the path and
+    a digest of the uncompressed body: per-user ETags can't be trusted to differ between
+    users, and hashing is far cheaper than compressing.
+    """
+
+    def __init__(self, app=None, min_size=COMPRESSION_MIN_SIZE, cache_size=256, cache_ttl=600):
+        self.min_size = min_size
+        self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.compress_response)
+
+    def _choose_encoding(self):
+        accepted = request.accept_encodings
+        best = max(self.encodings, key=lambda encoding: accepted[encoding])
+        return best if accepted[best] > 0 else None
+
+    def _compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=BROTLI_QUALITY)
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+    def compress_response(self, response):
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self._choose_encoding()
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        etag, _ = response.get_etag()
+        cache_key = (request.full_path, etag, encoding, hashlib.sha1(data).digest()) if etag else None
+        compressed = self._cache.get(cache_key) if cache_key else None
+        if compressed is None:
+            compressed = self._compress(data, encoding)
+            if cache_key:
+                self._cache.set(cache_key, compressed)
+
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,32 @@
+import logging
+from postgrest.exceptions import APIError
+from utils.ingredients import with_parsed_ingredients
+
+# PostgREST reports a function missing from its schema cache as PGRST202 (HTTP 404)
+MISSING_FUNCTION_CODES = {'PGRST202', '404'}
+
+def is_missing_function(error):
+    """True if an rpc() call failed only because the database function hasn't been created yet.
+
+    Anything else (a constraint, a timeout, a dropped connection after the function
+    committed) must not be retried through a non-transactional fallback.
+    """
+    return isinstance(error, APIError) and str(error.code) in MISSING_FUNCTION_CODES
+
+def is_missing_conflict_target(error):
+    """True if an upsert failed because no unique index matches its on_conflict columns (42P10)"""
+    return isinstance(error, APIError) and str(error.code) == '42P10'
+
+def execute_recipe_write(write, data):
+    """Run write(row).execute() with parsed ingredients attached.
+
+    Retries with the raw payload if the parsed_ingredients column hasn't been migrated yet.
+    """
+    row = with_parsed_ingredients(data)
+    try:
+        return write(row).execute()
+    except Exception as e:
+        if 'parsed_ingredients' not in row or 'parsed_ingredients' not in str(e):
+            raise
+        logging.warning(f'parsed_ingredients column unavailable, saving raw ingredients only: {e}')
+        return write(data).execute()
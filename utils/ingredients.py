@@ -0,0 +1,374 @@
+import heapq
+import math
+import os
+import re
+import threading
+from fractions import Fraction
+from functools import lru_cache
+from operator import itemgetter
+
+# Distinct raw ingredient lines whose parse is kept in memory
+INGREDIENT_PARSE_CACHE_SIZE = int(os.getenv('INGREDIENT_PARSE_CACHE_SIZE', 4096))
+
+# alias -> (canonical unit, factor to the dimension's base unit, dimension)
+# Mass is summed in grams and volume in millilitres; count units are kept as written.
+UNITS = {}
+
+def _register(names, unit, factor, dimension):
+    for name in names:
+        UNITS[name] = (unit, factor, dimension)
+
+_register(['g', 'gram', 'grams', 'gr'], 'g', 1, 'mass')
+_register(['kg', 'kilogram', 'kilograms', 'kilo', 'kilos'], 'g', 1000, 'mass')
+_register(['oz', 'ounce', 'ounces'], 'g', 28.3495, 'mass')
+_register(['lb', 'lbs', 'pound', 'pounds'], 'g', 453.592, 'mass')
+_register(['ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres'], 'ml', 1, 'volume')
+_register(['l', 'liter', 'liters', 'litre', 'litres'], 'ml', 1000, 'volume')
+_register(['tsp', 'teaspoon', 'teaspoons'], 'ml', 4.92892, 'volume')
+_register(['tbsp', 'tbs', 'tablespoon', 'tablespoons'], 'ml', 14.7868, 'volume')
+_register(['cup', 'cups'], 'ml', 236.588, 'volume')
+_register(['pint', 'pints'], 'ml', 473.176, 'volume')
+_register(['quart', 'quarts'], 'ml', 946.353, 'volume')
+for _count_unit in ['clove', 'can', 'slice', 'piece', 'bunch', 'pinch', 'stalk', 'head', 'sprig', 'fillet', 'packet']:
+    _register([_count_unit, _count_unit + 's', _count_unit + 'es'], _count_unit, 1, 'count')
+_register(['pc', 'pcs'], 'pcs', 1, 'count')
+
+UNICODE_FRACTIONS = {'½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4', '¾': '3/4', '⅛': '1/8'}
+
+# Leading quantity: "1", "2.5", "1/2", "1 1/2" or a range like "4-5" (the upper bound is used)
+QUANTITY_PATTERN = re.compile(r'^(\d+/\d+|\d+(?:\.\d+)?(?:\s+\d+/\d+)?)(?:\s*(?:-|to)\s*(\d+/\d+|\d+(?:\.\d+)?))?\s*')
+
+# Preparation notes that don't change what has to be bought
+PREPARATION_WORDS = {'diced', 'minced', 'chopped', 'sliced', 'juiced', 'grated', 'crushed', 'peeled', 'cubed', 'shredded', 'melted', 'softened', 'beaten', 'halved', 'trimmed', 'rinsed', 'drained', 'fresh', 'finely', 'roughly', 'thinly'}
+
+# Assumed to be in every kitchen; they don't count towards a recipe's ingredient coverage
+PANTRY_STAPLES = {'salt', 'pepper', 'black pepper', 'salt and pepper', 'water', 'ice'}
+
+# Singulars ending in -ie, whose plurals would otherwise become -y ("cookies" -> "cooky")
+IE_SINGULARS = {'cookie', 'brownie', 'smoothie', 'veggie', 'calorie', 'goodie', 'pie'}
+
+def _to_number(text):
+    return float(sum(Fraction(part) for part in text.split()))
+
+def parse_ingredient(text):
+    """Split a free-text ingredient line into {'text', 'quantity', 'unit', 'name'}.
+
+    quantity is None when the line has no leading amount ("Salt to taste");
+    unit is None when the amount is a plain count ("2 eggs").
+    """
+    text = text if isinstance(text, str) else ''
+    quantity, unit, name = _parse_cached(text)
+    return {'text': text, 'quantity': quantity, 'unit': unit, 'name': name}
+
+def parse_ingredients(lines):
+    """Parse a list of ingredient lines; anything that isn't a list parses to []"""
+    if not isinstance(lines, list):
+        return []
+    return [parse_ingredient(line) for line in lines]
+
+def recipe_ingredients(recipe):
+    """Parsed ingredients of a recipe row, reusing parsed_ingredients if it matches the raw lines"""
+    lines = recipe.get('ingredients') or []
+    stored = recipe.get('parsed_ingredients')
+    if isinstance(stored, list) and isinstance(lines, list) and [entry.get('text') for entry in stored] == lines:
+        return stored
+    return parse_ingredients(lines)
+
+@lru_cache(maxsize=INGREDIENT_PARSE_CACHE_SIZE)
+def _parse_cached(text):
+    # Keyed by the raw line; returns a tuple so cached results can't be mutated by callers
+    line = text.strip()
+    for symbol, fraction in UNICODE_FRACTIONS.items():
+        line = line.replace(symbol, f' {fraction}')
+    line = line.strip()
+
+    quantity = None
+    match = QUANTITY_PATTERN.match(line)
+    if match:
+        try:
+            quantity = _to_number(match.group(2) or match.group(1))
+            line = line[match.end():]
+        except (ValueError, ZeroDivisionError):
+            quantity = None
+
+    unit = None
+    words = line.split()
+    if words:
+        candidate = words[0].lower().rstrip('.')
+        if candidate in UNITS and len(words) > 1:
+            unit = candidate
+            words = words[1:]
+            if words and words[0].lower() == 'of':
+                words = words[1:]
+
+    return quantity, unit, clean_ingredient_name(' '.join(words))
+
+def clean_ingredient_name(name):
+    """Drop parentheticals, trailing notes after a comma, 'to taste' and preparation words"""
+    name = re.sub(r'\([^)]*\)', ' ', name).split(',')[0]
+    name = re.sub(r'\bto taste\b', ' ', name, flags=re.IGNORECASE)
+    words = [w for w in name.split() if w.lower() not in PREPARATION_WORDS]
+    return ' '.join(words).strip()
+
+def normalize_quantity(quantity, unit):
+    """Convert to the unit used for summing: grams, millilitres or the count unit ('pcs' if none)"""
+    if unit not in UNITS:
+        return quantity, unit or 'pcs'
+    canonical, factor, _ = UNITS[unit]
+    return (quantity * factor if quantity is not None else None), canonical
+
+def aggregate_ingredients(entries):
+    """Sum (ingredient, scale) pairs into one row per ingredient name and unit.
+
+    Ingredients may be raw lines or entries from parse_ingredient. Returns
+    [{'item_name', 'quantity', 'unit'}] with quantities rounded up to whole units;
+    ingredients without an amount are listed once with quantity 1.
+    """
+    totals = {}
+    for ingredient, scale in entries:
+        parsed = ingredient if isinstance(ingredient, dict) else parse_ingredient(ingredient)
+        if not parsed.get('name'):
+            continue
+        quantity, unit = normalize_quantity(parsed.get('quantity'), parsed.get('unit'))
+        key = (parsed['name'].lower(), unit)
+        total = totals.setdefault(key, {'item_name': parsed['name'], 'quantity': None, 'unit': unit})
+        if quantity is not None:
+            total['quantity'] = (total['quantity'] or 0) + quantity * scale
+
+    for total in totals.values():
+        total['quantity'] = max(1, math.ceil(round(total['quantity'], 6))) if total['quantity'] else 1
+    return list(totals.values())
+
+def with_parsed_ingredients(data):
+    """Copy of a recipe insert/update payload with parsed_ingredients set whenever ingredients is"""
+    data = dict(data)
+    if data.get('ingredients') is not None:
+        data['parsed_ingredients'] = parse_ingredients(data['ingredients'])
+    return data
+
+def _singular(word):
+    # -us, -ss and -sses words aren't plurals: asparagus, hummus, couscous, molasses
+    if word.endswith(('us', 'ss', 'sses')):
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-1] if word[:-1] in IE_SINGULARS else word[:-3] + 'y'
+    if word.endswith('oes') and len(word) > 4:
+        return word[:-2]
+    if word.endswith('s') and len(word) > 3:
+        return word[:-1]
+    return word
+
+def ingredient_key(name):
+    """Normalized ingredient name used for matching: "Cherry Tomatoes" -> "cherry tomato".
+
+    Accepts an ingredient name or a whole line ("2 cups of rice"); returns '' if nothing is left.
+    """
+    return _ingredient_key(name) if isinstance(name, str) else ''
+
+@lru_cache(maxsize=INGREDIENT_PARSE_CACHE_SIZE)
+def _ingredient_key(name):
+    words = re.findall(r'[^\W\d_]+', parse_ingredient(name)['name'].lower())
+    if words:
+        words[-1] = _singular(words[-1])
+    return ' '.join(words)
+
+def _head(key):
+    # The last word names what the ingredient is: "cherry tomato" is a kind of "tomato"
+    return key.rsplit(' ', 1)[-1]
+
+def _bitset(numbers):
+    bits = bytearray((max(numbers) >> 3) + 1 if numbers else 0)
+    for number in numbers:
+        bits[number >> 3] |= 1 << (number & 7)
+    return int.from_bytes(bits, 'little')
+
+def _lowest_bits(bits, count):
+    """Positions of the lowest count set bits of an int, in ascending order"""
+    positions = []
+    while bits and len(positions) < count:
+        lowest = bits & -bits
+        positions.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return positions
+
+class IngredientIndex:
+    """Recipes by normalized ingredient, for "what can I cook with these" queries.
+
+    Every recipe gets a number. Each ingredient maps to the set of recipe numbers using it,
+    and common ingredients also to a bitset of them, kept current as recipes change. A query
+    adds up the bitsets of the available ingredients bit-sliced (one int per bit of the
+    per-recipe count) and then reads recipes out by coverage, best first, so no per-recipe
+    loop runs however many recipes share an ingredient.
+    A recipe's owner limits it to that viewer; None makes it visible to everyone.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}     # ingredient key -> {doc number}
+        self._dense = {}        # ingredient key -> bitset of its postings, for common ingredients
+        self._heads = {}        # head word -> {ingredient keys ending in it}
+        self._docs = {}         # doc number -> (recipe key, {ingredient key: name as the recipe has it}, owner)
+        self._numbers = {}      # recipe key -> doc number
+        self._sizes = {}        # ingredient count -> bitset of docs with that many
+        self._public = 0        # bitset of docs without an owner
+        self._owned = {}        # owner -> {doc number}
+        self._free = []         # numbers of removed docs, reused so bitsets stay short
+        self._next_number = 0
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def add(self, key, ingredients, owner=None):
+        """Index a recipe's ingredient names or lines under key, replacing any previous version"""
+        names = {}
+        for name in ingredients:
+            ingredient = ingredient_key(name)
+            if ingredient and ingredient not in PANTRY_STAPLES:
+                names.setdefault(ingredient, parse_ingredient(name)['name'] or name.strip())
+        keys = names.keys()
+        with self._lock:
+            self._remove(key)
+            if not keys:
+                return
+            if self._free:
+                number = self._free.pop()
+            else:
+                number = self._next_number
+                self._next_number += 1
+            bit = 1 << number
+            self._numbers[key] = number
+            self._docs[number] = (key, names, owner)
+            self._sizes[len(keys)] = self._sizes.get(len(keys), 0) | bit
+            if owner is None:
+                self._public |= bit
+            else:
+                self._owned.setdefault(owner, set()).add(number)
+            for ingredient in keys:
+                postings = self._postings.get(ingredient)
+                if postings is None:
+                    postings = self._postings[ingredient] = set()
+                    self._heads.setdefault(_head(ingredient), set()).add(ingredient)
+                postings.add(number)
+                if ingredient in self._dense:
+                    self._dense[ingredient] |= bit
+
+    def rebuild(self, documents):
+        """Replace the contents with documents, an iterable of (key, ingredients, owner),
+        built on the side so queries keep using the old contents meanwhile"""
+        fresh = IngredientIndex()
+        for key, ingredients, owner in documents:
+            fresh.add(key, ingredients, owner)
+        with self._lock:
+            for name in ('_postings', '_dense', '_heads', '_docs', '_numbers', '_sizes',
+                         '_public', '_owned', '_free', '_next_number'):
+                setattr(self, name, getattr(fresh, name))
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        number = self._numbers.pop(key, None)
+        if number is None:
+            return
+        _, names, owner = self._docs.pop(number)
+        keys = names.keys()
+        bit = 1 << number
+        self._sizes[len(keys)] &= ~bit
+        if not self._sizes[len(keys)]:
+            del self._sizes[len(keys)]
+        if owner is None:
+            self._public &= ~bit
+        else:
+            owned = self._owned[owner]
+            owned.discard(number)
+            if not owned:
+                del self._owned[owner]
+        for ingredient in keys:
+            postings = self._postings[ingredient]
+            postings.discard(number)
+            if ingredient in self._dense:
+                self._dense[ingredient] &= ~bit
+            if not postings:
+                del self._postings[ingredient]
+                self._dense.pop(ingredient, None)
+                heads = self._heads[_head(ingredient)]
+                heads.discard(ingredient)
+                if not heads:
+                    del self._heads[_head(ingredient)]
+        self._free.append(number)
+
+    def _covered_keys(self, available):
+        """Indexed ingredient keys covered by what's available: the same ingredient, any kind
+        of it ("tomato" covers "cherry tomato") or what a kind of it is ("cherry tomato" covers "tomato")"""
+        covered = set()
+        for ingredient in available:
+            covered.add(ingredient)
+            covered.update(self._heads.get(ingredient, ()))
+            covered.add(_head(ingredient))
+        return {ingredient for ingredient in covered if ingredient in self._postings}
+
+    def _posting_bits(self, ingredient):
+        """Bitset of an ingredient's recipes; kept (and updated on changes) once it's used by
+        more than 1 in 512 recipes, where it takes less memory than the set"""
+        bits = self._dense.get(ingredient)
+        if bits is None:
+            postings = self._postings[ingredient]
+            bits = _bitset(postings)
+            if len(postings) >= max(64, self._next_number >> 9):
+                self._dense[ingredient] = bits
+        return bits
+
+    def match(self, ingredients, viewer=None, limit=20):
+        """Recipes best covered by ingredients, as [{'key', 'coverage', 'matched', 'missing'}].
+
+        coverage is the share of the recipe's ingredients (staples aside) that are available;
+        ties go to the recipe using more of them. matched and missing list the recipe's own
+        ingredient names.
+        """
+        available = set(filter(None, map(ingredient_key, ingredients)))
+        if not available or limit <= 0:
+            return []
+        with self._lock:
+            covered = self._covered_keys(available)
+            visible = self._public | _bitset(self._owned.get(viewer, ()))
+
+            # planes[i] has bit n set if bit i of recipe n's matched-ingredient count is set
+            planes = []
+            for ingredient in covered:
+                carry = self._posting_bits(ingredient) & visible
+                for i, plane in enumerate(planes):
+                    if not carry:
+                        break
+                    planes[i], carry = plane ^ carry, plane & carry
+                if carry:
+                    planes.append(carry)
+            if not planes:
+                return []
+
+            counted = {}
+            def with_count(matched):
+                if matched not in counted:
+                    bits = visible if matched >> len(planes) == 0 else 0
+                    for i, plane in enumerate(planes):
+                        bits &= plane if matched >> i & 1 else ~plane
+                    counted[matched] = bits
+                return counted[matched]
+
+            most = (1 << len(planes)) - 1
+            buckets = sorted(((matched, size) for size in self._sizes for matched in range(1, min(size, most) + 1)),
+                             key=lambda bucket: (bucket[0] / bucket[1], bucket[0]), reverse=True)
+            results = []
+            for matched, size in buckets:
+                bits = with_count(matched) & self._sizes[size]
+                for number in _lowest_bits(bits, limit - len(results)):
+                    key, names, _ = self._docs[number]
+                    results.append({
+                        'key': key,
+                        'coverage': round(matched / size, 3),
+                        'matched': sorted(names[ingredient] for ingredient in names.keys() & covered),
+                        'missing': sorted(names[ingredient] for ingredient in names.keys() - covered)
+                    })
+                if len(results) >= limit:
+                    break
+            return results
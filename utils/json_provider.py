@@ -0,0 +1,57 @@
+import logging
+import os
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class OrjsonProvider(DefaultJSONProvider):
+    """app.json backed by orjson; anything orjson can't encode falls back to the stdlib encoder.
+
+    Output matches DefaultJSONProvider (sorted keys, Flask's handling of dates and
+    other extra types) except that non-ASCII characters are written as UTF-8.
+    """
+
+    if orjson is not None:
+        options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps_bytes(self, obj):
+        """Serialize to UTF-8 bytes, e.g. for bodies that are cached and served as-is"""
+        try:
+            return orjson.dumps(obj, default=self.default, option=self.options)
+        except TypeError:
+            return super().dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Indented debug output keeps the stdlib path
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+def use_fast_json(app):
+    """Install OrjsonProvider as app.json when orjson is available (disable with FAST_JSON=0)"""
+    if orjson is None or os.getenv('FAST_JSON', '1') == '0':
+        logging.info('Using the standard JSON provider')
+        return False
+    app.json = OrjsonProvider(app)
+    return True
+
+def json_bytes(app, obj):
+    """Encode obj once for a pre-serialized response body"""
+    dumps_bytes = getattr(app.json, 'dumps_bytes', None)
+    if dumps_bytes is not None:
+        return dumps_bytes(obj)
+    return app.json.dumps(obj).encode('utf-8')
@@ -0,0 +1,26 @@
+import base64
+import json
+
+def encode_cursor(state):
+    """Encode cursor state as an opaque URL-safe token"""
+    raw = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Decode a token produced by encode_cursor; raises ValueError if it is malformed"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(state, dict):
+        raise ValueError('Invalid cursor')
+    return state
+
+def parse_page_size(value, default=20, maximum=50):
+    """Clamp a client supplied page size to [1, maximum]"""
+    try:
+        size = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
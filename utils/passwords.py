@@ -0,0 +1,70 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Full Werkzeug method string, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'.
+# Stored hashes whose method differs are upgraded on the next successful login.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_SALT_LENGTH = int(os.getenv('PASSWORD_SALT_LENGTH', 16))
+# 0 hashes in the calling thread (useful for scripts and tests)
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+
+# Werkzeug fills in defaults for a short method ('pbkdf2:sha256' is stored as
+# 'pbkdf2:sha256:1000000'), so compare stored hashes with the prefix of a real one
+_HASH_PREFIX = generate_password_hash('', PASSWORD_HASH_METHOD, 1).split('$', 1)[0]
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    """Per-process pool; key derivation runs outside the web worker so it never holds its GIL"""
+    global _executor, _executor_pid
+    if _executor is not None and _executor_pid == os.getpid():
+        return _executor
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # spawn: forking a process that already runs request threads is unsafe
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+def _run(fn, *args):
+    if PASSWORD_HASH_WORKERS <= 0:
+        return fn(*args)
+    return _get_executor().submit(fn, *args).result()
+
+def hash_password(password):
+    return _run(generate_password_hash, password, PASSWORD_HASH_METHOD, PASSWORD_SALT_LENGTH)
+
+def verify_password(password_hash, password):
+    if not password_hash:
+        return False
+    return _run(check_password_hash, password_hash, password)
+
+def needs_rehash(password_hash):
+    """True if the stored hash was made with a different method or cost than configured"""
+    return bool(password_hash) and password_hash.split('$', 1)[0] != _HASH_PREFIX
+
+def rehash_in_background(password, on_hashed):
+    """Compute a fresh hash in the pool and pass it to on_hashed without blocking the caller"""
+    def done(future):
+        try:
+            on_hashed(future.result())
+        except Exception as e:
+            logging.warning(f'Password rehash failed: {e}')
+
+    if PASSWORD_HASH_WORKERS <= 0:
+        try:
+            on_hashed(hash_password(password))
+        except Exception as e:
+            logging.warning(f'Password rehash failed: {e}')
+        return
+    future = _get_executor().submit(generate_password_hash, password, PASSWORD_HASH_METHOD, PASSWORD_SALT_LENGTH)
+    future.add_done_callback(done)
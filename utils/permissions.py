@@ -0,0 +1,48 @@
+import logging
+from utils.cache import TTLCache
+
+# The user app's built-in roles, used there until the admin_role_permissions table can be read
+DEFAULT_ROLE_PERMISSIONS = {
+    'super_admin': ['admin_management', 'user_management', 'recipe_management', 'analytics_view', 'system_settings'],
+    'sub_admin': ['user_management', 'recipe_management', 'analytics_view'],
+    'marketing_admin': ['analytics_view', 'marketing_campaigns']
+}
+
+# After a failed load, how long to keep answering from the fallback before querying again
+RETRY_INTERVAL = 30
+
+class PermissionRegistry:
+    """Role -> permission names for all roles, loaded with one query and reloaded every refresh_interval seconds.
+
+    The tables are only written by migrations, so nothing invalidates the registry early.
+    If a reload fails the last good registry is kept; before the first good load the
+    registry is defaults, which is empty (deny) unless a caller passes its own.
+    """
+
+    def __init__(self, supabase, refresh_interval=300, defaults=None):
+        self.supabase = supabase
+        self.defaults = defaults or {}
+        self._cache = TTLCache(maxsize=1, ttl=refresh_interval)
+        self._last_good = None
+
+    def _load(self):
+        result = self.supabase.table('admin_role_permissions').select('role, admin_permissions(name)').execute()
+        registry = {}
+        for row in result.data:
+            permission = row.get('admin_permissions') or {}
+            if permission.get('name'):
+                registry.setdefault(row['role'], []).append(permission['name'])
+        return registry or self.defaults
+
+    def get(self, role):
+        registry = self._cache.get('registry')
+        if registry is None:
+            try:
+                registry = self._load()
+                self._last_good = registry
+                self._cache.set('registry', registry)
+            except Exception as e:
+                registry = self._last_good if self._last_good is not None else self.defaults
+                logging.warning(f'Failed to load role permissions, using the {"last loaded" if self._last_good is not None else "default"} set: {e}')
+                self._cache.set('registry', registry, ttl=RETRY_INTERVAL)
+        return list(registry.get(role, []))
@@ -0,0 +1,27 @@
+import os
+from utils.cache import TTLCache
+
+# Public profile fields; never includes password_hash
+PROFILE_COLUMNS = 'id, email, name, phone, location, bio'
+profile_cache = TTLCache(
+    maxsize=int(os.getenv('PROFILE_CACHE_SIZE', 10000)),
+    ttl=int(os.getenv('PROFILE_CACHE_TTL', 120))
+)
+
+def get_profile(supabase, user_id):
+    """Cached profile row for a user, or None if the user doesn't exist"""
+    profile = profile_cache.get(str(user_id))
+    if profile is None:
+        result = supabase.table('users').select(PROFILE_COLUMNS).eq('id', user_id).execute()
+        if not result.data:
+            return None
+        profile = result.data[0]
+        profile_cache.set(str(user_id), profile)
+    return profile
+
+def cache_profile(user_id, profile):
+    """Write-through after an update, so the next read sees the new profile"""
+    profile_cache.set(str(user_id), profile)
+
+def invalidate_profile(user_id):
+    profile_cache.delete(str(user_id))
@@ -0,0 +1,191 @@
+from utils.validation import Schema, String, Integer, Number, Boolean, OneOf, List, Dict, Object
+
+# Per-request limits; the routes import these so the schema rejects oversized input up front
+MAX_PARSE_INGREDIENTS = 500
+MAX_BULK_OPERATIONS = 200
+MAX_SLOT_EDITS = 100
+MAX_RANGE_WEEKS = 12
+
+# Building blocks shared by several bodies
+ID = OneOf(String(max_length=100), Integer())
+TEXT = String(max_length=5000)
+SERVINGS = Integer(minimum=0, maximum=1000, numeric_string=True)
+MINUTES = Integer(minimum=0, maximum=10000, numeric_string=True)
+WEEK = String(max_length=50)
+SLOT_NAME = String(max_length=20)
+INGREDIENTS = List(OneOf(String(max_length=500), Dict(max_keys=20)), max_items=200)
+INSTRUCTIONS = List(OneOf(String(max_length=2000), Dict(max_keys=20)), max_items=200)
+TAGS = List(String(max_length=50), max_items=50)
+DIFFICULTY = String(max_length=20)
+
+# Auth and account
+CREDENTIALS = Schema({
+    'email': String(max_length=255),
+    'password': String(max_length=1024),
+}, max_bytes=4096)
+
+PROFILE_UPDATE = Schema({
+    'name': String(max_length=255),
+    'phone': String(max_length=50),
+    'location': String(max_length=255),
+    'bio': String(max_length=2000),
+}, max_bytes=16 * 1024)
+
+PASSWORD_CHANGE = Schema({
+    'current_password': String(max_length=1024),
+    'new_password': String(max_length=1024),
+}, max_bytes=4096)
+
+# Recipes
+RECIPE = Schema({
+    'title': String(max_length=255),
+    'name': String(max_length=255),
+    'description': TEXT,
+    'ingredients': INGREDIENTS,
+    'instructions': INSTRUCTIONS,
+    'prep_time': MINUTES,
+    'cook_time': MINUTES,
+    'time': String(max_length=50),
+    'servings': SERVINGS,
+    'difficulty': DIFFICULTY,
+    'tags': TAGS,
+    'image': String(max_length=255),
+})
+
+SAVED_RECIPE = Schema({
+    'recipe_id': ID,
+    'recipe_data': Dict(max_keys=50),
+})
+
+INGREDIENT_LINES = Schema({
+    'ingredients': List(String(max_length=500), max_items=MAX_PARSE_INGREDIENTS, required=True),
+})
+
+# Shopping
+SHOPPING_ITEM_FIELDS = {
+    'item_name': String(max_length=255),
+    'category': String(max_length=100),
+    'quantity': Integer(minimum=0, maximum=100000, numeric_string=True),
+    'unit': String(max_length=50),
+}
+
+SHOPPING_ITEM = Schema(SHOPPING_ITEM_FIELDS, max_bytes=16 * 1024)
+
+SHOPPING_ITEM_UPDATE = Schema({
+    'is_completed': Boolean(),
+    'quantity': SHOPPING_ITEM_FIELDS['quantity'],
+}, max_bytes=4096)
+
+# Each operation is checked in the route against SHOPPING_ITEM/SHOPPING_ITEM_UPDATE,
+# so a bad one only fails itself
+SHOPPING_BULK = Schema({
+    'operations': List(max_items=MAX_BULK_OPERATIONS, required=True),
+})
+
+SHOPPING_GENERATE = Schema({
+    'week': WEEK,
+}, max_bytes=4096)
+
+# Household
+PERSON = Schema({
+    'name': String(max_length=255),
+    'preferences': String(max_length=2000),
+    'allergies': String(max_length=2000),
+}, max_bytes=16 * 1024)
+
+PREFERENCES = Schema({
+    'selected_week': WEEK,
+    'view_mode': String(max_length=20),
+}, max_bytes=4096)
+
+# Meal plans
+MEAL = Schema({
+    'week': WEEK,
+    'day': SLOT_NAME,
+    'meal_time': SLOT_NAME,
+    'recipe_id': ID,
+    'recipe_name': String(max_length=255),
+    'servings': SERVINGS,
+    'image': String(max_length=255),
+    'time': String(max_length=50),
+}, max_bytes=16 * 1024)
+
+MEAL_SLOTS = Schema({
+    'week': WEEK,
+    'slots': List(Object(Schema({
+        'week': WEEK,
+        'day': SLOT_NAME,
+        'meal_time': SLOT_NAME,
+        'recipe_id': ID,
+        'recipe_name': String(max_length=255),
+        'servings': SERVINGS,
+        'image': String(max_length=255),
+        'time': String(max_length=50),
+        'clear': Boolean(),
+    })), max_items=MAX_SLOT_EDITS, required=True),
+})
+
+MEAL_PLAN_COPY = Schema({
+    'source_week': WEEK,
+    'target_weeks': List(WEEK, max_items=MAX_RANGE_WEEKS),
+    'replace': Boolean(),
+}, max_bytes=16 * 1024)
+
+MEAL_PLAN_BULK = Schema({
+    'month': Integer(minimum=1, maximum=12),
+    'year': Integer(minimum=1, maximum=9999),
+    'week': WEEK,
+    'idempotency_key': String(max_length=255),
+}, max_bytes=4096)
+
+APPLY_TEMPLATE = Schema({
+    'template_id': String(max_length=100),
+    'week': WEEK,
+}, max_bytes=4096)
+
+# Admin
+ADMIN_USER = Schema({
+    'email': String(max_length=255),
+    'password': String(max_length=1024),
+    'name': String(max_length=255),
+    'role': String(max_length=50),
+}, max_bytes=16 * 1024)
+
+ADMIN_RECIPE = Schema({
+    'title': String(max_length=255),
+    'description': TEXT,
+    'ingredients': INGREDIENTS,
+    'instructions': INSTRUCTIONS,
+    'cook_time': MINUTES,
+    'servings': SERVINGS,
+    'difficulty': DIFFICULTY,
+    'category': String(max_length=100),
+    'image': String(max_length=255),
+    'author': String(max_length=255),
+    'status': String(max_length=50),
+})
+
+# meals is {day: {meal_time: {recipe_name, servings, image}}}
+TEMPLATE_MEAL = Object(Schema({
+    'recipe_name': String(max_length=255),
+    'servings': SERVINGS,
+    'image': String(max_length=255),
+}))
+
+ADMIN_MEAL_PLAN = Schema({
+    'name': String(max_length=255),
+    'description': TEXT,
+    'week_start': String(max_length=50),
+    'meals': Dict(Dict(TEMPLATE_MEAL, max_keys=10), max_keys=14),
+    'created_by': String(max_length=255),
+    'status': String(max_length=50),
+    'is_admin_template': Boolean(),
+})
+
+SUBSCRIPTION_PLAN = Schema({
+    'name': String(max_length=255),
+    'price': Number(minimum=0),
+    'interval': String(max_length=20),
+    'features': List(String(max_length=500), max_items=100),
+    'status': String(max_length=50),
+}, max_bytes=16 * 1024)
@@ -0,0 +1,331 @@
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from itertools import islice
+from operator import itemgetter
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+STOP_WORDS = {'a', 'an', 'and', 'or', 'of', 'the', 'with', 'in', 'on', 'to', 'for', 'by'}
+
+# Prefixes shorter than this only match whole words; a one-letter prefix would expand to
+# a large part of the vocabulary
+MIN_PREFIX_LENGTH = 2
+# A prefix expands to at most this many words, the most common ones first
+MAX_PREFIX_EXPANSIONS = 50
+# Words completed from a prefix score less than the word itself ("rice" over "ricotta" for "ric")
+PREFIX_WEIGHT = 0.7
+# Results of recent queries, dropped whenever the index changes
+MAX_CACHED_RESULTS = 1024
+# Words whose documents are kept in score order for searching, the most recently used ones
+MAX_RANKED_TERMS = 1024
+
+def tokenize(text):
+    """Lowercase words of text without stop words; non-strings tokenize to []"""
+    if not isinstance(text, str):
+        return []
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+def _best_first(ranked, idf):
+    """(score, doc number) from a _ranked_documents list, highest first"""
+    for saturation, number in reversed(ranked):
+        yield idf * saturation, number
+
+class SearchIndex:
+    """In-memory inverted index with BM25 ranking and prefix matching.
+
+    Documents are {field: text or list of texts}; each field counts with its weight
+    from field_weights, so a title match outranks an ingredient match. Documents can be
+    added, replaced and removed at any time; searches see each change as a whole.
+    """
+
+    def __init__(self, field_weights, k1=1.2, b=0.75):
+        self.field_weights = field_weights
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._postings = {}      # term -> {doc number: weighted term frequency}
+            self._vocabulary = []    # sorted terms, for prefix lookups
+            self._doc_terms = {}     # doc number -> {term: weighted term frequency}
+            self._doc_lengths = {}
+            self._numbers = {}       # key -> doc number
+            self._keys = {}          # doc number -> key
+            self._next_number = 0
+            self._total_length = 0
+            self._results = {}
+            self._ranked = {}        # term -> [(saturation, doc number)] ascending, see _ranked_documents
+            self._ranked_basis = (0, 0)
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def __contains__(self, key):
+        return key in self._numbers
+
+    def _analyze(self, document):
+        terms = {}
+        for field, weight in self.field_weights.items():
+            values = document.get(field)
+            if values is None:
+                continue
+            for value in (values if isinstance(values, (list, tuple)) else [values]):
+                for token in tokenize(value):
+                    terms[token] = terms.get(token, 0) + weight
+        return terms
+
+    def add(self, key, document):
+        """Index document under key, replacing any previous version"""
+        terms = self._analyze(document)
+        with self._lock:
+            self._remove(key)
+            self._results.clear()
+            if not terms:
+                return
+            number = self._next_number
+            self._next_number += 1
+            self._numbers[key] = number
+            self._keys[number] = key
+            self._doc_terms[number] = terms
+            length = sum(terms.values())
+            self._doc_lengths[number] = length
+            self._total_length += length
+            self._move_basis()
+            for term, frequency in terms.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    insort(self._vocabulary, term)
+                postings[number] = frequency
+                ranked = self._ranked.get(term)
+                if ranked is not None:
+                    insort(ranked, (self._saturation(frequency, length), number))
+
+    def rebuild(self, documents):
+        """Replace the contents with documents, an iterable of (key, document).
+
+        The new index is built on the side, so searches keep using the old contents
+        until it is complete.
+        """
+        fresh = SearchIndex(self.field_weights, self.k1, self.b)
+        for key, document in documents:
+            fresh.add(key, document)
+        with self._lock:
+            for name in ('_postings', '_vocabulary', '_doc_terms', '_doc_lengths', '_numbers',
+                         '_keys', '_next_number', '_total_length', '_results', '_ranked', '_ranked_basis'):
+                setattr(self, name, getattr(fresh, name))
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+            self._results.clear()
+
+    def _remove(self, key):
+        number = self._numbers.pop(key, None)
+        if number is None:
+            return
+        del self._keys[number]
+        length = self._doc_lengths.pop(number)
+        self._total_length -= length
+        terms = self._doc_terms.pop(number)
+        for term, frequency in terms.items():
+            ranked = self._ranked.get(term)
+            if ranked is not None:
+                del ranked[bisect_left(ranked, (self._saturation(frequency, length), number))]
+            postings = self._postings[term]
+            del postings[number]
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect_left(self._vocabulary, term)]
+                self._ranked.pop(term, None)
+        self._move_basis()
+
+    def _move_basis(self):
+        # Scores use the collection size and average length as of the basis, so the ranked
+        # lists stay in order as documents come and go; the basis moves, dropping them all,
+        # once the collection has grown or shrunk by a tenth
+        count = self._ranked_basis[0]
+        if abs(len(self._numbers) - count) > count // 10:
+            self._ranked.clear()
+            self._ranked_basis = (len(self._numbers), self._total_length)
+
+    def _length_scaling(self):
+        """(constant, per_length) such that K = constant + per_length * document length"""
+        count, total_length = self._ranked_basis
+        return self.k1 * (1 - self.b), self.k1 * self.b * count / total_length
+
+    def _saturation(self, frequency, length):
+        """The BM25 term frequency part, frequency / (frequency + K); a score is idf times this"""
+        constant, per_length = self._length_scaling()
+        return frequency / (frequency + constant + per_length * length)
+
+    def _ranked_documents(self, term):
+        """[(saturation, doc number)] for every document with term, ascending.
+
+        Built on first use and then kept up to date by add and remove; the idf is left out
+        since it is the same for the whole list.
+        """
+        ranked = self._ranked.get(term)
+        if ranked is None:
+            constant, per_length = self._length_scaling()
+            lengths = self._doc_lengths
+            ranked = sorted((frequency / (frequency + constant + per_length * lengths[number]), number)
+                            for number, frequency in self._postings[term].items())
+            self._ranked[term] = ranked
+            if len(self._ranked) > MAX_RANKED_TERMS:
+                self._ranked.pop(next(iter(self._ranked)))
+        return ranked
+
+    def _expand(self, token):
+        """[(term, weight)] for a query word: the word itself plus, for long enough words,
+        the most common indexed words it is a prefix of"""
+        expansions = [(token, 1.0)] if token in self._postings else []
+        if len(token) < MIN_PREFIX_LENGTH:
+            return expansions
+        start = bisect_left(self._vocabulary, token)
+        end = bisect_left(self._vocabulary, token + '\uffff', start)
+        completions = (term for term in self._vocabulary[start:end] if term != token)
+        if end - start > MAX_PREFIX_EXPANSIONS:
+            completions = heapq.nlargest(MAX_PREFIX_EXPANSIONS, completions, key=lambda term: len(self._postings[term]))
+        expansions.extend((term, PREFIX_WEIGHT) for term in completions)
+        return expansions
+
+    def _idf(self, term, weight):
+        count = self._ranked_basis[0]
+        frequency = len(self._postings[term])
+        return math.log(1 + max(count - frequency + 0.5, 0) / (frequency + 0.5)) * weight * (self.k1 + 1)
+
+    def _term_scores(self, expansions):
+        """{doc number: best BM25 score among the expansions}"""
+        constant, per_length = self._length_scaling()
+        lengths = self._doc_lengths
+        scores = {}
+        for term, weight in expansions:
+            idf = self._idf(term, weight)
+            items = self._postings[term].items()
+            if not scores:
+                scores = {number: idf * frequency / (frequency + constant + per_length * lengths[number])
+                          for number, frequency in items}
+                continue
+            for number, frequency in items:
+                score = idf * frequency / (frequency + constant + per_length * lengths[number])
+                if score > scores.get(number, 0):
+                    scores[number] = score
+        return scores
+
+    def search(self, query, limit=20):
+        """[(key, score)] best first; documents matching every query word rank above partial matches"""
+        tokens = tuple(dict.fromkeys(tokenize(query)))
+        if not tokens or limit <= 0:
+            return []
+        with self._lock:
+            cached = self._results.get((tokens, limit))
+            if cached is None:
+                cached = self._results[(tokens, limit)] = self._search(tokens, limit)
+                if len(self._results) > MAX_CACHED_RESULTS:
+                    self._results.pop(next(iter(self._results)))
+            return list(cached)
+
+    def _search(self, tokens, limit):
+        if not self._numbers:
+            return []
+        expanded = [expansions for expansions in map(self._expand, tokens) if expansions]
+        if not expanded:
+            return []
+
+        best = self._best_with_every_word(expanded, limit)
+        if len(best) == limit:
+            return [(self._keys[number], round(score, 4)) for score, number in best]
+
+        # Too few documents have every word; fill up with partial matches below them
+        ranked = {}
+        for expansions in expanded:
+            for number, score in self._term_scores(expansions).items():
+                matched, total = ranked.get(number, (0, 0))
+                ranked[number] = (matched + 1, total + score)
+        best = heapq.nlargest(limit, ranked.items(), key=itemgetter(1))
+        return [(self._keys[number], round(total, 4)) for number, (_, total) in best]
+
+    def _best_with_every_word(self, expanded, limit):
+        """Up to limit (score, doc number) among documents with every query word, best first.
+
+        Reads each word's documents in score order, in batches that double in size, scores
+        the new ones that have every word, and stops as soon as the limit-th best beats the
+        sum of the scores last read: no document not yet seen can score more than that (the
+        threshold algorithm). Common words are therefore never scored in full. Fewer than
+        limit results means fewer documents have every word.
+        """
+        # Per word, its ranked list and idf, or for a prefix the expansions merged into one stream
+        sources = []
+        words = []
+        for expansions in expanded:
+            if len(expansions) == 1:
+                term, weight = expansions[0]
+                sources.append((self._ranked_documents(term), self._idf(term, weight)))
+            else:
+                sources.append((heapq.merge(*(_best_first(self._ranked_documents(term), self._idf(term, weight))
+                                              for term, weight in expansions), reverse=True), None))
+            words.append([(self._postings[term], self._idf(term, weight)) for term, weight in expansions])
+        constant, per_length = self._length_scaling()
+        lengths = self._doc_lengths
+
+        def score(number):
+            length_term = constant + per_length * lengths[number]
+            total = 0
+            for expansions in words:
+                best = 0
+                for postings, idf in expansions:
+                    frequency = postings.get(number)
+                    if frequency is not None:
+                        word_score = idf * frequency / (frequency + length_term)
+                        if word_score > best:
+                            best = word_score
+                if not best:
+                    return None
+                total += best
+            return total
+
+        bounds = [math.inf] * len(sources)
+        seen = set()
+        top = []
+        read = 0
+        batch = limit
+        while True:
+            fresh = set()
+            exhausted = False
+            for position, (source, idf) in enumerate(sources):
+                if idf is None:
+                    items = list(islice(source, batch))
+                    if items:
+                        bounds[position] = items[-1][0]
+                else:
+                    end = len(source) - read
+                    items = source[max(end - batch, 0):end]
+                    if items:
+                        bounds[position] = idf * items[0][0]
+                if len(items) < batch:
+                    # Every document with this word has been seen, so every one with all words too
+                    exhausted = True
+                fresh.update(map(itemgetter(1), items))
+            read += batch
+            fresh -= seen
+            seen |= fresh
+            # Drop documents missing a word without scoring them where that is a plain key lookup
+            for expansions in words:
+                if len(expansions) == 1:
+                    fresh &= expansions[0][0].keys()
+            for number in fresh:
+                total = score(number)
+                if total is None:
+                    continue
+                if len(top) < limit:
+                    heapq.heappush(top, (total, number))
+                elif (total, number) > top[0]:
+                    heapq.heapreplace(top, (total, number))
+            if exhausted or (len(top) == limit and top[0][0] >= sum(bounds)):
+                return sorted(top, reverse=True)
+            batch *= 2
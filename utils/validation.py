@@ -0,0 +1,190 @@
+import os
+import re
+from functools import wraps
+from flask import request, jsonify, g
+from werkzeug.exceptions import BadRequest
+
+# Limits applied to every validated body; a schema can lower max_bytes
+MAX_BODY_BYTES = int(os.getenv('MAX_BODY_BYTES', 256 * 1024))
+MAX_JSON_DEPTH = int(os.getenv('MAX_JSON_DEPTH', 8))
+
+class ValidationError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+class Field:
+    """A compiled check for one value; built with the helpers below, not directly"""
+
+    def __init__(self, check, required=False):
+        self.check = check
+        self.required = required
+
+def String(max_length=255, choices=None, required=False):
+    def check(value, path):
+        if not isinstance(value, str):
+            raise ValidationError(f'{path} must be a string')
+        if len(value) > max_length:
+            raise ValidationError(f'{path} must be at most {max_length} characters')
+        if choices is not None and value not in choices:
+            raise ValidationError(f'{path} must be one of: {", ".join(sorted(choices))}')
+    return Field(check, required)
+
+def Integer(minimum=None, maximum=None, numeric_string=False, required=False):
+    """An int (never a bool); numeric_string also accepts strings of digits, as some clients send"""
+    def check(value, path):
+        # ASCII digits only: str.isdigit() also accepts "²", which int() rejects
+        if numeric_string and isinstance(value, str) and re.fullmatch(r'[0-9]{1,10}', value.strip()):
+            value = int(value)
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValidationError(f'{path} must be an integer')
+        if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            raise ValidationError(f'{path} must be between {minimum} and {maximum}')
+    return Field(check, required)
+
+def Number(minimum=None, maximum=None, required=False):
+    def check(value, path):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValidationError(f'{path} must be a number')
+        if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            raise ValidationError(f'{path} must be between {minimum} and {maximum}')
+    return Field(check, required)
+
+def Boolean(required=False):
+    def check(value, path):
+        if not isinstance(value, bool):
+            raise ValidationError(f'{path} must be true or false')
+    return Field(check, required)
+
+def OneOf(*fields, required=False):
+    """Accepts a value that passes any of fields, e.g. an id sent as a string or an int"""
+    def check(value, path):
+        errors = []
+        for field in fields:
+            try:
+                field.check(value, path)
+                return
+            except ValidationError as e:
+                errors.append(str(e))
+        raise ValidationError(' or '.join(errors))
+    return Field(check, required)
+
+def List(items=None, max_items=100, required=False):
+    def check(value, path):
+        if not isinstance(value, list):
+            raise ValidationError(f'{path} must be a list')
+        if len(value) > max_items:
+            raise ValidationError(f'{path} must have at most {max_items} items')
+        if items is not None:
+            for index, item in enumerate(value):
+                if item is None and not items.required:
+                    continue
+                items.check(item, f'{path}[{index}]')
+    return Field(check, required)
+
+def Dict(values=None, max_keys=50, required=False):
+    """An object with arbitrary string keys; values, if given, checks every value"""
+    def check(value, path):
+        if not isinstance(value, dict):
+            raise ValidationError(f'{path} must be an object')
+        if len(value) > max_keys:
+            raise ValidationError(f'{path} must have at most {max_keys} keys')
+        for key, item in value.items():
+            if len(key) > 100:
+                raise ValidationError(f'{path} has a key longer than 100 characters')
+            if values is not None and item is not None:
+                values.check(item, f'{path}.{key}')
+    return Field(check, required)
+
+def Object(schema, required=False):
+    def check(value, path):
+        schema.validate(value, f'{path}.')
+    return Field(check, required)
+
+class Schema:
+    """Named fields compiled into one validator; unknown keys are left for the handler to ignore.
+
+    None and '' count as absent, matching the data.get(...) handling in the routes.
+    """
+
+    def __init__(self, fields, max_bytes=MAX_BODY_BYTES):
+        self.max_bytes = max_bytes
+        self._checks = [(name, field.check, field.required) for name, field in fields.items()]
+
+    def validate(self, data, prefix=''):
+        if not isinstance(data, dict):
+            raise ValidationError(f'{prefix.rstrip(".") or "Body"} must be an object')
+        for name, check, required in self._checks:
+            value = data.get(name)
+            if value is None or value == '':
+                if required:
+                    raise ValidationError(f'{prefix}{name} is required')
+                continue
+            check(value, f'{prefix}{name}')
+        return data
+
+def check_depth(value, limit=MAX_JSON_DEPTH):
+    stack = [(value, 1)]
+    while stack:
+        value, depth = stack.pop()
+        if isinstance(value, dict):
+            children = value.values()
+        elif isinstance(value, list):
+            children = value
+        else:
+            continue
+        if depth > limit:
+            raise ValidationError(f'Body nested deeper than {limit} levels')
+        stack.extend((child, depth + 1) for child in children)
+
+def load_body(schema):
+    """Decode and validate the JSON body; Flask caches the result for request.get_json()"""
+    if request.content_length is not None and request.content_length > schema.max_bytes:
+        raise ValidationError('Request body too large', 413)
+    raw = request.get_data(cache=True)
+    if len(raw) > schema.max_bytes:
+        raise ValidationError('Request body too large', 413)
+    if not raw.strip():
+        return schema.validate({})
+    if not request.is_json:
+        raise ValidationError('Content-Type must be application/json', 415)
+    try:
+        data = request.get_json()
+    except BadRequest:
+        raise ValidationError('Malformed JSON body')
+    except RecursionError:
+        # The stdlib decoder recurses per nesting level, so depth is only known after decoding
+        raise ValidationError(f'Body nested deeper than {MAX_JSON_DEPTH} levels')
+    check_depth(data)
+    return schema.validate(data)
+
+def validate_body(schemas, authenticate=None):
+    """Reject bodies that don't match the schema for this method before the route runs.
+
+    schemas is a Schema, or {method: Schema} for routes that also serve GET/DELETE.
+    The route reads the validated body with request_body().
+    authenticate, if given, runs first and returns an error response (or None), so a
+    caller without a valid token gets the route's 401 rather than a 400/413 for the body.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            schema = schemas.get(request.method) if isinstance(schemas, dict) else schemas
+            if schema is not None and request.method in ('POST', 'PUT', 'PATCH'):
+                if authenticate is not None:
+                    error = authenticate()
+                    if error is not None:
+                        return error
+                try:
+                    g.body = load_body(schema)
+                except ValidationError as e:
+                    return jsonify({'error': str(e)}), e.status
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def request_body():
+    """The body @validate_body decoded and checked for this request; {} if it was empty"""
+    if 'body' in g:
+        return g.body
+    return request.get_json(silent=True) or {}